@@ -1,78 +1,126 @@
 import json
-import unicodedata
+import os
+import stat
 import sys
-import re
+import argparse
+import tempfile
+import textwrap
 from collections import OrderedDict
 
-def generate_id(name):
-    # Convert to lowercase
-    id_string = name.lower()
-    
-    # Replace special quotes and similar characters with empty string
-    id_string = re.sub(r'[''""″\'\"ʻ]', '', id_string)
-    
-    # Replace all types of dashes/hyphens with underscore
-    id_string = re.sub(r'[\-\–\—]', '_', id_string)
-    
-    # Replace spaces (including non-breaking space \u00a0) with underscores
-    id_string = re.sub(r'[\s\u00a0]+', '_', id_string)
-    
-    # Remove diacritics/accents
-    id_string = ''.join(
-        c for c in unicodedata.normalize('NFKD', id_string)
-        if not unicodedata.combining(c)
-    )
-    
-    # Remove all remaining punctuation and special characters except underscores
-    id_string = re.sub(r'[^\w\s]', '', id_string)
-    
-    return id_string
-
-def add_ids_to_json(input_file, output_file=None):
+from entity_ids import (
+    DEFAULT_NAME_FIELDS, IdAssigner, find_name_field, load_id_map, print_collision_report,
+    save_id_map
+)
+from json_stream import NotAJsonArrayError, iter_json_array
+from pipeline_io import save_records
+from telemetry import telemetry
+
+def with_id(item, assigner, name_fields):
+    # Check for one of the name fields
+    name_field = find_name_field(item, name_fields)
+
+    if name_field is None:
+        fields = ' or '.join(f"'{field}'" for field in name_fields)
+        raise ValueError(f"Objects must contain a {fields} field")
+
+    # Create new ordered dictionary with id first
+    ordered_item = OrderedDict()
+    ordered_item['id'] = assigner.assign(item[name_field])
+    # Add all other fields
+    ordered_item.update(item)
+    return ordered_item
+
+def replacement_mode(path):
+    # Permissions for a file written via a temp file: mkstemp creates it
+    # 0600, so keep the mode of the file being replaced, or use what a plain
+    # open() would give a new file under the current umask
+    if os.path.exists(path):
+        return stat.S_IMODE(os.stat(path).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+def stream_ids_to_json(input_file, output_file, assigner, name_fields, compact=False):
+    # Read one object at a time and write it straight out, so memory use
+    # doesn't grow with the file. Output goes to a temp file in the same
+    # directory that replaces output_file only once everything is written,
+    # which also makes input_file == output_file safe.
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
     try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            count = 0
+            for item in iter_json_array(input_file):
+                if not isinstance(item, dict):
+                    raise ValueError("JSON file must contain a list of objects")
+                item = with_id(item, assigner, name_fields)
+
+                # Match json.dump's layout for the whole list
+                if compact:
+                    f.write(('[' if count == 0 else ',') +
+                            json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+                else:
+                    f.write(('[\n' if count == 0 else ',\n') +
+                            textwrap.indent(json.dumps(item, indent=2, ensure_ascii=False), '  '))
+                count += 1
+
+            if count == 0:
+                f.write('[]')
+            else:
+                f.write(']' if compact else '\n]')
+        os.chmod(temp_path, replacement_mode(output_file))
+        os.replace(temp_path, output_file)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def add_ids_to_json(input_file, output_file=None, name_fields=DEFAULT_NAME_FIELDS, id_map_file=None,
+                    stream=False, compact=False):
+    try:
+        # Determine output file name
+        if output_file is None:
+            output_file = input_file.rsplit('.', 1)[0] + '_with_ids.json'
+
+        # Ids already handed out in earlier runs are reused
+        assigner = IdAssigner(load_id_map(id_map_file))
+
+        if stream:
+            stream_ids_to_json(input_file, output_file, assigner, name_fields, compact)
+            print_collision_report(assigner.collision_report())
+            if id_map_file is not None:
+                save_id_map(assigner.id_map, id_map_file)
+            print(f"Successfully added IDs and saved to {output_file}")
+            return
+
         # Read the JSON file
         with open(input_file, 'r', encoding='utf-8') as f:
             data = json.load(f)
-        
+
         # Check if data is a list
         if not isinstance(data, list):
             raise ValueError("JSON file must contain a list of objects")
-        
+
         # Process each object
         for i, item in enumerate(data):
-            # Check for 'name' or 'Name' field
-            name_field = next((field for field in ['name', 'Name'] 
-                             if field in item), None)
-            
-            if name_field is None:
-                raise ValueError("Objects must contain a 'name' or 'Name' field")
-            
-            # Generate id
-            new_id = generate_id(item[name_field])
-            
-            # Create new ordered dictionary with id first
-            ordered_item = OrderedDict()
-            ordered_item['id'] = new_id
-            # Add all other fields
-            ordered_item.update(item)
-            
-            # Replace original item with ordered version
-            data[i] = ordered_item
-        
-        # Determine output file name
-        if output_file is None:
-            output_file = input_file.rsplit('.', 1)[0] + '_with_ids.json'
-        
+            # Replace original item with a copy that has the id first
+            data[i] = with_id(item, assigner, name_fields)
+
+        print_collision_report(assigner.collision_report())
+
         # Write the updated JSON
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
+        if compact:
+            save_records(data, output_file, ensure_ascii=False, indent=None, separators=(',', ':'))
+        else:
+            save_records(data, output_file, ensure_ascii=False)
+        if id_map_file is not None:
+            save_id_map(assigner.id_map, id_map_file)
+
         print(f"Successfully added IDs and saved to {output_file}")
-        
+
     except FileNotFoundError:
         print(f"Error: File '{input_file}' not found")
         sys.exit(1)
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, NotAJsonArrayError):
         print(f"Error: '{input_file}' is not a valid JSON file")
         sys.exit(1)
     except Exception as e:
@@ -80,11 +128,21 @@ def add_ids_to_json(input_file, output_file=None):
         sys.exit(1)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python add_ids_to_json.py <input_json_file> [output_json_file]")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
-    
-    add_ids_to_json(input_file, output_file)
+    parser = argparse.ArgumentParser(description='Add an id field generated from each object\'s name')
+    parser.add_argument('input_file', help='JSON file containing a list of objects')
+    parser.add_argument('output_file', nargs='?', help='Defaults to <input>_with_ids.json')
+    parser.add_argument('--field', action='append', dest='fields',
+                        help='Field to build the id from, tried in order (default: name, Name)')
+    parser.add_argument('--id-map',
+                        help='JSON file of name -> id kept across runs so ids stay stable')
+    parser.add_argument('--stream', action='store_true',
+                        help='Process one object at a time for very large files')
+    parser.add_argument('--compact', action='store_true',
+                        help='Write minified JSON instead of indenting it')
+    args = parser.parse_args()
+
+    with telemetry.stage('add ids'):
+        add_ids_to_json(
+            args.input_file, args.output_file, tuple(args.fields or DEFAULT_NAME_FIELDS), args.id_map,
+            stream=args.stream, compact=args.compact
+        )
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from distance_matrix import EARTH_RADIUS_MILES, ERROR_BOUNDS, geodesic_matrix, geodesic_pairs
+
+# Candidates are gathered on the sphere and then re-ranked with the exact
+# geodesic, so widen every search radius by the worst-case spherical error
+SPHERE_SLACK = 1 + 2 * ERROR_BOUNDS['haversine']['relative']
+
+
+def _to_unit_vectors(lats, lons):
+    # Points on the unit sphere, where straight-line (chord) distance grows
+    # monotonically with great-circle distance
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack((
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+    ))
+
+
+def _miles_to_chord(miles):
+    angle = np.clip(np.asarray(miles, dtype=float) / EARTH_RADIUS_MILES, 0, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+class SphereIndex:
+    # k-d tree over latitude/longitude points answering k-nearest and
+    # within-radius queries, with distances in geodesic miles
+
+    def __init__(self, lats, lons, tie_breaker=None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        # Optional per-point sort key used when two distances are equal
+        self.tie_breaker = None if tie_breaker is None else np.asarray(tie_breaker).astype(str)
+
+        # Points without coordinates can never be returned by a query
+        self.valid_positions = np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+        self.tree = cKDTree(_to_unit_vectors(
+            self.lats[self.valid_positions], self.lons[self.valid_positions]
+        ))
+
+    def __len__(self):
+        return len(self.valid_positions)
+
+    def _candidates_within(self, lat, lon, miles):
+        query = _to_unit_vectors([lat], [lon])[0]
+        found = self.tree.query_ball_point(query, _miles_to_chord(miles * SPHERE_SLACK), return_sorted=True)
+        return self.valid_positions[np.asarray(found, dtype=int)]
+
+    def _candidate_pairs(self, queries, miles):
+        # Batch version of _candidates_within: (query numbers, positions)
+        # with one entry per candidate of every query
+        found = self.tree.query_ball_point(queries, _miles_to_chord(miles * SPHERE_SLACK), return_sorted=True)
+        counts = np.fromiter((len(candidates) for candidates in found), dtype=int, count=len(found))
+        positions = np.fromiter(
+            (position for candidates in found for position in candidates), dtype=int, count=counts.sum()
+        )
+        return np.repeat(np.arange(len(found)), counts), self.valid_positions[positions]
+
+    def _order(self, distances, positions):
+        if self.tie_breaker is None:
+            return np.argsort(distances, kind='stable')
+        return np.lexsort((self.tie_breaker[positions], distances))
+
+    def _rank(self, lat, lon, positions):
+        distances = geodesic_matrix([lat], [lon], self.lats[positions], self.lons[positions])[0]
+        order = self._order(distances, positions)
+        return distances[order], positions[order]
+
+    def nearest(self, lat, lon, k=1):
+        # Return (distances, positions) of the k closest points
+        k = min(k, len(self))
+        if k == 0:
+            return np.array([]), np.array([], dtype=int)
+
+        # The k nearest on the sphere bound the true k-th geodesic distance,
+        # so everything that could beat them lies inside that radius
+        query = _to_unit_vectors([lat], [lon])[0]
+        _, found = self.tree.query(query, k=k)
+        positions = self.valid_positions[np.atleast_1d(found)]
+        bound = geodesic_matrix([lat], [lon], self.lats[positions], self.lons[positions]).max()
+
+        distances, positions = self._rank(lat, lon, self._candidates_within(lat, lon, bound))
+        return distances[:k], positions[:k]
+
+    def nearest_many(self, lats, lons, k=1):
+        # nearest() for many query points at once, with the tree searches and
+        # geodesics done in bulk. Returns one (distances, positions) per point;
+        # points without coordinates get empty results.
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        results = [(np.array([]), np.array([], dtype=int))] * len(lats)
+        k = min(k, len(self))
+        valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        if k == 0 or len(valid) == 0:
+            return results
+
+        query_lats, query_lons = lats[valid], lons[valid]
+        queries = _to_unit_vectors(query_lats, query_lons)
+        _, found = self.tree.query(queries, k=k)
+        found = self.valid_positions[np.asarray(found).reshape(len(valid), k)]
+        bounds = geodesic_pairs(
+            np.repeat(query_lats, k), np.repeat(query_lons, k),
+            self.lats[found.ravel()], self.lons[found.ravel()]
+        ).reshape(len(valid), k).max(axis=1)
+
+        query_numbers, positions = self._candidate_pairs(queries, bounds)
+        distances = geodesic_pairs(
+            query_lats[query_numbers], query_lons[query_numbers], self.lats[positions], self.lons[positions]
+        )
+        ends = np.cumsum(np.bincount(query_numbers, minlength=len(valid)))
+        start = 0
+        for number, end in enumerate(ends):
+            order = self._order(distances[start:end], positions[start:end])[:k]
+            results[valid[number]] = (distances[start:end][order], positions[start:end][order])
+            start = end
+        return results
+
+    def any_within(self, lats, lons, miles):
+        # For many query points, whether any indexed point lies within the
+        # radius; the same answer as len(within(...)[0]) > 0 for each point
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        result = np.zeros(len(lats), dtype=bool)
+        valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        if len(self) == 0 or len(valid) == 0:
+            return result
+
+        # The nearest point on the sphere settles most queries on its own
+        queries = _to_unit_vectors(lats[valid], lons[valid])
+        _, found = self.tree.query(queries, k=1)
+        nearest = self.valid_positions[found]
+        hit = geodesic_pairs(lats[valid], lons[valid], self.lats[nearest], self.lons[nearest]) <= miles
+
+        # Otherwise a slightly farther point on the sphere can still be
+        # within the radius on the ellipsoid, so check every candidate
+        unsure = np.flatnonzero(~hit)
+        if len(unsure):
+            query_numbers, positions = self._candidate_pairs(queries[unsure], miles)
+            rows = valid[unsure][query_numbers]
+            close = geodesic_pairs(lats[rows], lons[rows], self.lats[positions], self.lons[positions]) <= miles
+            hit[unsure] = np.bincount(query_numbers[close], minlength=len(unsure)) > 0
+
+        result[valid] = hit
+        return result
+
+    def within(self, lat, lon, miles):
+        # Return (distances, positions) of every point within the radius, closest first
+        distances, positions = self._rank(lat, lon, self._candidates_within(lat, lon, miles))
+        keep = distances <= miles
+        return distances[keep], positions[keep]
+
+
+class AirportIndex:
+    # Spatial index over an airports table with latitude/longitude columns,
+    # e.g. iata-icao.csv or filtered_airports.csv
+
+    def __init__(self, airports_df, lat_col='latitude', lon_col='longitude', code_col='iata'):
+        self.airports = airports_df.reset_index(drop=True)
+        tie_breaker = self.airports[code_col] if code_col in self.airports else None
+        self.index = SphereIndex(
+            self.airports[lat_col], self.airports[lon_col], tie_breaker=tie_breaker
+        )
+
+    @classmethod
+    def from_csv(cls, csv_path, **kwargs):
+        return cls(pd.read_csv(csv_path), **kwargs)
+
+    def _rows(self, distances, positions):
+        rows = self.airports.iloc[positions].copy()
+        rows['distance_miles'] = distances
+        return rows
+
+    def nearest_airports(self, lat, lon, k=3):
+        return self._rows(*self.index.nearest(lat, lon, k))
+
+    def airports_within(self, lat, lon, miles):
+        return self._rows(*self.index.within(lat, lon, miles))
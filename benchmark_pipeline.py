@@ -0,0 +1,345 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from entity_ids import generate_ids
+from json_to_csv import json_to_csv
+from llm_client import LLMClient
+from llm_stub import echo_responder
+from telemetry import read_events
+
+# Times the pipeline stages on synthetic copies of the real data scaled up
+# 1x, 10x, 100x and 1000x, and compares the timings against a saved baseline.
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+# The description pipeline makes one stub call per park, so by default it
+# stops at a smaller scale than the pure data stages
+DEFAULT_LLM_MAX_SCALE = 10
+DEFAULT_BASELINE_PATH = 'benchmark_baseline.json'
+# A stage this many times slower than its baseline counts as a regression
+DEFAULT_TOLERANCE = 1.25
+# Differences smaller than this are timer noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.01
+# Benchmarks --benchmarks can pick from
+BENCHMARK_NAMES = ['filter_airports', 'generate_id', 'json_to_csv', 'descriptions']
+
+# Boilerplate the stub rewrites add, repeated across parks the way real
+# rewrites repeat themselves, so the optimizer has descriptions to send
+STOCK_SENTENCES = [
+    "The park offers visitors a chance to explore a remarkable variety of landscapes and habitats.",
+    "Outdoor enthusiasts can enjoy hiking, camping and wildlife viewing throughout much of the year.",
+    "Rangers lead guided walks and evening programs about the natural and cultural history of the area.",
+    "Visitors should check current trail and road conditions before setting out for the day.",
+]
+
+
+def _copy_codes(codes, copy):
+    # The original codes for copy 0, suffixed ones (e.g. ANC17) for the rest
+    if copy == 0:
+        return codes
+    return codes.where(codes.isna(), codes.astype('string') + str(copy))
+
+
+def synthetic_parks(parks_df, scale, rng):
+    # scale copies of every park, each copy renamed and moved up to ~100 miles
+    copies = []
+    for copy in range(scale):
+        parks = parks_df.copy()
+        if copy:
+            parks['Name'] = parks['Name'] + f" {copy}"
+            parks['Latitude'] = (parks['Latitude'] + rng.uniform(-1.5, 1.5, len(parks))).clip(-89.9, 89.9)
+            parks['Longitude'] = parks['Longitude'] + rng.uniform(-1.5, 1.5, len(parks))
+        copies.append(parks)
+    return pd.concat(copies, ignore_index=True)
+
+
+def synthetic_airports(airports_df, iata_icao_df, suggested_df, scale, rng):
+    # scale copies of the hub table with unique codes per copy, plus matching
+    # moved copies of their reference rows and of the suggested airports
+    hub_copies, reference_copies, suggested_copies = [airports_df], [iata_icao_df], [suggested_df]
+    matched = iata_icao_df[iata_icao_df['iata'].isin(airports_df['IATA'].dropna())]
+    for copy in range(1, scale):
+        hubs = airports_df.copy()
+        for column in ('FAA', 'IATA', 'ICAO'):
+            hubs[column] = _copy_codes(hubs[column], copy)
+        hub_copies.append(hubs)
+
+        reference = matched.copy()
+        for column in ('iata', 'icao'):
+            reference[column] = _copy_codes(reference[column], copy)
+        reference['latitude'] = (reference['latitude'] + rng.uniform(-1, 1, len(reference))).clip(-89.9, 89.9)
+        reference['longitude'] = reference['longitude'] + rng.uniform(-1, 1, len(reference))
+        reference_copies.append(reference)
+
+        suggested = suggested_df.copy()
+        suggested['National Park'] = suggested['National Park'] + f" {copy}"
+        suggested['Code'] = _copy_codes(suggested['Code'], copy)
+        suggested_copies.append(suggested)
+
+    return (
+        pd.concat(hub_copies, ignore_index=True),
+        pd.concat(reference_copies, ignore_index=True),
+        pd.concat(suggested_copies, ignore_index=True),
+    )
+
+
+def write_dataset(directory, scale, seed=0):
+    # Write scaled copies of every pipeline input into directory
+    rng = np.random.RandomState(seed)
+    parks = synthetic_parks(pd.read_csv('national_parks.csv'), scale, rng)
+    parks.to_csv(os.path.join(directory, 'national_parks.csv'), index=False)
+    with open(os.path.join(directory, 'national_parks.json'), 'w', encoding='utf-8') as file:
+        json.dump(parks.to_dict('records'), file, indent=2)
+
+    airports, reference, suggested = synthetic_airports(
+        pd.read_csv('airports_1.csv'),
+        pd.read_csv('iata-icao.csv', keep_default_na=False, na_values=['']),
+        pd.read_csv('GPT_Suggested_National_Parks_Airports.csv'),
+        scale, rng
+    )
+    airports.to_csv(os.path.join(directory, 'airports_1.csv'), index=False)
+    reference.to_csv(os.path.join(directory, 'iata-icao.csv'), index=False)
+    suggested.to_csv(os.path.join(directory, 'GPT_Suggested_National_Parks_Airports.csv'), index=False)
+    return {'parks': len(parks), 'airports': len(airports)}
+
+
+@contextlib.contextmanager
+def quiet():
+    # The stages print progress for every item, which would dominate the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_filter_airports(directory, sizes):
+    # Run the real script on the synthetic inputs and read back the time of
+    # its distance and closest-airport steps from its telemetry
+    script = os.path.abspath('filter_airports.py')
+    telemetry_path = os.path.join(directory, 'telemetry.jsonl')
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, script], cwd=directory, check=True, stdout=subprocess.DEVNULL,
+        env=dict(os.environ, TELEMETRY_PATH=telemetry_path)
+    )
+    total = time.perf_counter() - start
+    stages = {event['stage']: event['seconds'] for event in read_events(telemetry_path) if event['event'] == 'stage'}
+    return {
+        'filter_airports': {'seconds': total, 'items': sizes['airports']},
+        'filter_airports.distance': {
+            'seconds': stages.get('distance filter', 0.0) + stages.get('closest airports', 0.0),
+            'items': sizes['airports'],
+        },
+    }
+
+
+def bench_generate_id(directory, sizes):
+    names = pd.read_csv(os.path.join(directory, 'national_parks.csv'), usecols=['Name'])['Name'].tolist()
+    start = time.perf_counter()
+    generate_ids(names)
+    return {'generate_id': {'seconds': time.perf_counter() - start, 'items': len(names)}}
+
+
+def bench_json_to_csv(directory, sizes):
+    start = time.perf_counter()
+    with quiet():
+        json_to_csv(os.path.join(directory, 'national_parks.json'), os.path.join(directory, 'parks.csv'))
+    return {'json_to_csv': {'seconds': time.perf_counter() - start, 'items': sizes['parks']}}
+
+
+def repetitive_responder(messages):
+    # Echo the description with up to two stock sentences added, picked by
+    # the prompt so every run gives the same text
+    rng = random.Random(messages[-1]['content'])
+    return ' '.join([echo_responder(messages)] + rng.sample(STOCK_SENTENCES, rng.choice([0, 1, 2])))
+
+
+def bench_descriptions(directory, sizes, latency=0.05, concurrency=8):
+    # Rewrite and optimize passes against the stub client, without the
+    # response cache, journal or rate limiter so only the pipeline is timed.
+    # The rewrites come back repetitive so the optimize pass has work to do.
+    from update_descriptions import optimize_descriptions, rewrite_descriptions
+
+    with open(os.path.join(directory, 'national_parks.json'), 'r', encoding='utf-8') as file:
+        parks_data = json.load(file)
+    rewriter = LLMClient('stub', latency=latency, jitter=0.0, seed=0, responder=repetitive_responder)
+    optimizer = LLMClient('stub', latency=latency, jitter=0.0, seed=0)
+
+    with quiet():
+        start = time.perf_counter()
+        rewritten = rewrite_descriptions(rewriter, parks_data, concurrency)
+        rewrite_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        optimize_descriptions(optimizer, rewritten, concurrency=concurrency)
+        optimize_seconds = time.perf_counter() - start
+
+    return {
+        'descriptions.rewrite': {'seconds': rewrite_seconds, 'items': len(parks_data)},
+        'descriptions.optimize': {'seconds': optimize_seconds, 'items': len(parks_data)},
+    }
+
+
+def run_benchmarks(scales, llm_max_scale, repeat=1, latency=0.05, concurrency=8, seed=0, only=None):
+    # {benchmark: {scale: {'seconds', 'items', 'per_item_us'}}}, keeping the
+    # fastest of `repeat` runs. only limits the run to some BENCHMARK_NAMES.
+    results = {}
+    for scale in scales:
+        benchmarks = {
+            'filter_airports': bench_filter_airports,
+            'generate_id': bench_generate_id,
+            'json_to_csv': bench_json_to_csv,
+        }
+        if scale <= llm_max_scale:
+            benchmarks['descriptions'] = (
+                lambda directory, sizes: bench_descriptions(directory, sizes, latency, concurrency)
+            )
+        benchmarks = [benchmark for name, benchmark in benchmarks.items() if only is None or name in only]
+        if not benchmarks:
+            continue
+
+        directory = tempfile.mkdtemp(prefix=f'bench-{scale}x-')
+        try:
+            print(f"Generating {scale}x dataset...")
+            sizes = write_dataset(directory, scale, seed)
+            print(f"  {sizes['parks']} parks, {sizes['airports']} airports")
+
+            for benchmark in benchmarks:
+                for _ in range(repeat):
+                    for name, timing in benchmark(directory, sizes).items():
+                        best = results.setdefault(name, {}).get(str(scale))
+                        if best is None or timing['seconds'] < best['seconds']:
+                            results[name][str(scale)] = {
+                                'seconds': round(timing['seconds'], 4),
+                                'items': timing['items'],
+                                'per_item_us': round(timing['seconds'] / max(timing['items'], 1) * 1e6, 2),
+                            }
+            for name in sorted(results):
+                if str(scale) in results[name]:
+                    print(f"  {name:<28} {results[name][str(scale)]['seconds']:>9.3f}s")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Print each timing next to its baseline and return the regressions
+    regressions = []
+    print(f"\n{'benchmark':<28} {'scale':>6} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for name, by_scale in sorted(results.items()):
+        for scale, timing in sorted(by_scale.items(), key=lambda item: int(item[0])):
+            previous = baseline.get('results', {}).get(name, {}).get(scale)
+            if previous is None:
+                print(f"{name:<28} {scale + 'x':>6} {'-':>10} {timing['seconds']:>9.3f}s {'new':>7}")
+                continue
+            ratio = timing['seconds'] / max(previous['seconds'], 1e-9)
+            slower = timing['seconds'] - previous['seconds'] >= MIN_REGRESSION_SECONDS
+            flag = '  REGRESSION' if ratio > tolerance and slower else ''
+            print(
+                f"{name:<28} {scale + 'x':>6} {previous['seconds']:>9.3f}s "
+                f"{timing['seconds']:>9.3f}s {ratio:>6.2f}x{flag}"
+            )
+            if flag:
+                regressions.append((name, scale, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on scaled-up synthetic data')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='Dataset sizes as multiples of the current data')
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARK_NAMES,
+                        help='Only run these benchmarks (default: all), e.g. to update just their baseline')
+    parser.add_argument('--llm-max-scale', type=int, default=DEFAULT_LLM_MAX_SCALE,
+                        help='Largest scale to run the stubbed description pipeline at')
+    parser.add_argument('--stub-latency', type=float, default=0.05,
+                        help='Simulated seconds per stub LLM call')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Concurrent stub calls in the description pipeline')
+    parser.add_argument('--repeat', type=int,
+                        help="Run each benchmark this many times and keep the fastest "
+                             "(default: the baseline's setting, or 1 without a baseline)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output',
+                        help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH,
+                        help='Baseline JSON to compare against')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Slowdown ratio that counts as a regression')
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+    # A single run is noisier than the best of the baseline's runs, so time
+    # each benchmark as often as the baseline did unless told otherwise
+    repeat = args.repeat or (baseline or {}).get('settings', {}).get('repeat', 1)
+
+    results = run_benchmarks(
+        args.scales, args.llm_max_scale, repeat, args.stub_latency, args.concurrency, args.seed,
+        args.benchmarks
+    )
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': machine_info(),
+        'settings': {
+            'stub_latency': args.stub_latency, 'concurrency': args.concurrency,
+            'repeat': repeat, 'seed': args.seed,
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.update_baseline:
+        # Only the benchmarks and scales that ran are replaced, so a baseline
+        # can be built up from separate runs (e.g. 1000x on its own)
+        if baseline is not None:
+            for name, by_scale in baseline.get('results', {}).items():
+                for scale, timing in by_scale.items():
+                    results.setdefault(name, {}).setdefault(scale, timing)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return
+
+    if baseline.get('machine') != report['machine']:
+        print("Warning: the baseline was recorded on a different machine")
+    if baseline.get('settings') != report['settings']:
+        print(f"Warning: the baseline was recorded with different settings ({baseline.get('settings')})")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than {args.tolerance}x their baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+
+from park_airports import LOOKUP_PATH, PARKS_PATH, join_park_airports
+from pipeline_io import load_records
+
+# brotli is optional and only used with --brotli, so a bundle has the same
+# files whichever machine builds it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# A symlink to the directory of the current build, app_bundle.<hash>
+BUNDLE_DIR = 'app_bundle'
+# The only file without a content hash in its name: the app fetches it
+# fresh (no-cache) and everything it points to can be cached forever
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 10
+# File suffix of each precompressed copy
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+# Columns of the index rows, which hold everything the park list needs
+INDEX_FIELDS = ['id', 'name', 'lat', 'lon', 'area_acres', 'visitors', 'detail']
+
+# "49,071.40 acres (198.6 km2)" -> 49071.40
+_AREA_ACRES = re.compile(r'([\d,]+(?:\.\d+)?)\s*acres')
+
+
+def minify(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(stem, data):
+    return f"{stem}.{content_hash(data)}.json"
+
+
+def area_acres(area):
+    match = _AREA_ACRES.search(area or '')
+    return float(match.group(1).replace(',', '')) if match else None
+
+
+def _number(value, kind=float):
+    return None if value is None or value != value else kind(value)
+
+
+def index_row(park, detail_path):
+    return [
+        park['id'],
+        park['Name'],
+        _number(park.get('Latitude')),
+        _number(park.get('Longitude')),
+        area_acres(park.get('Area')),
+        _number(park.get('Annual_Visitors'), int),
+        detail_path,
+    ]
+
+
+def compressed_copies(data, use_brotli=False):
+    # Encoding -> bytes for every encoding that actually makes the file
+    # smaller. gzip gets mtime=0 so the same input gives the same bytes.
+    copies = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if use_brotli:
+        copies['br'] = brotli.compress(data, quality=11)
+    return {encoding: copy for encoding, copy in copies.items() if len(copy) < len(data)}
+
+
+def build_bundle(parks, use_brotli=False):
+    # {relative path: bytes} of every bundle file, and the manifest. The
+    # files are one detail shard per park, the compact index pointing at
+    # them, their precompressed copies and the manifest itself.
+    documents = {}
+    rows = []
+    for park in parks:
+        data = minify(park)
+        path = f"parks/{hashed_name(park['id'], data)}"
+        documents[path] = data
+        rows.append(index_row(park, path))
+
+    index = minify({'fields': INDEX_FIELDS, 'parks': rows})
+    index_path = hashed_name('index', index)
+    documents[index_path] = index
+
+    files = {}
+    entries = {}
+    for path, data in documents.items():
+        files[path] = data
+        copies = compressed_copies(data, use_brotli)
+        for encoding, copy in copies.items():
+            files[path + ENCODING_SUFFIXES[encoding]] = copy
+        entries[path] = {
+            'bytes': len(data),
+            'encodings': {encoding: len(copy) for encoding, copy in copies.items()},
+        }
+
+    manifest = {'version': content_hash(index), 'index': index_path, 'files': entries}
+    files[MANIFEST_NAME] = minify(manifest)
+    return files, manifest
+
+
+def write_bundle(files, bundle_dir=BUNDLE_DIR):
+    # Write the build into its own directory, named by the manifest's hash,
+    # then point the bundle_dir symlink at it. Replacing the symlink is
+    # atomic, so there is always a complete bundle at bundle_dir, and files
+    # of an older build never linger next to the new ones.
+    build_dir = f"{bundle_dir}.{content_hash(files[MANIFEST_NAME])}"
+    if not os.path.isdir(build_dir):
+        staging = build_dir + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        for path, data in files.items():
+            target = os.path.join(staging, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as file:
+                file.write(data)
+        os.replace(staging, build_dir)
+
+    previous = None
+    if os.path.islink(bundle_dir):
+        previous = os.path.join(os.path.dirname(bundle_dir), os.readlink(bundle_dir))
+    elif os.path.isdir(bundle_dir):
+        # A bundle written before builds were versioned: move it aside once
+        # so the symlink can take its place
+        previous = f"{bundle_dir}.unversioned"
+        os.replace(bundle_dir, previous)
+
+    link = bundle_dir + '.link.tmp'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(build_dir), link)
+    os.replace(link, bundle_dir)
+
+    # Keep the build the app may still be reading from, drop any older ones
+    keep = {os.path.abspath(build_dir), os.path.abspath(previous) if previous else None}
+    build_name = re.compile(re.escape(os.path.basename(bundle_dir)) + rf'\.([0-9a-f]{{{HASH_LENGTH}}}|unversioned)')
+    parent = os.path.dirname(bundle_dir) or '.'
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if build_name.fullmatch(name) and not os.path.islink(path) and os.path.abspath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+    return build_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the minified, precompressed data bundle for the app')
+    parser.add_argument('parks_file', nargs='?', default=PARKS_PATH,
+                        help='Parks JSON with ids from add_ids_to_json')
+    parser.add_argument('--airports', default=LOOKUP_PATH,
+                        help='Park id -> airports lookup to add to the detail files, skipped if missing')
+    parser.add_argument('--output-dir', default=BUNDLE_DIR,
+                        help='Symlink to the current build, written next to it as <output-dir>.<hash>')
+    parser.add_argument('--brotli', action='store_true',
+                        help='Also write .br copies (needs the brotli package)')
+    args = parser.parse_args()
+
+    if args.brotli and brotli is None:
+        print("Error: --brotli needs the brotli package (pip install brotli)")
+        sys.exit(1)
+
+    try:
+        parks = load_records(args.parks_file)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if os.path.exists(args.airports):
+        parks, missing = join_park_airports(parks, load_records(args.airports))
+        if missing:
+            print(f"Warning: no airports for {len(missing)} parks: {', '.join(missing)}")
+    else:
+        print(f"Warning: {args.airports} not found, detail files will have no airports")
+
+    files, manifest = build_bundle(parks, args.brotli)
+    build_dir = write_bundle(files, args.output_dir)
+
+    index = manifest['files'][manifest['index']]
+    shards = [entry for path, entry in manifest['files'].items() if path.startswith('parks/')]
+    print(
+        f"Index {manifest['index']}: {index['bytes']} bytes, "
+        f"{index['encodings'].get('gzip', index['bytes'])} gzipped"
+        + (f", {index['encodings']['br']} brotli" if 'br' in index['encodings'] else '')
+    )
+    print(
+        f"{len(shards)} detail files: {sum(entry['bytes'] for entry in shards)} bytes, "
+        f"{sum(entry['encodings'].get('gzip', entry['bytes']) for entry in shards)} gzipped"
+    )
+    print(
+        f"Saved the bundle to {os.path.join(args.output_dir, MANIFEST_NAME)} -> {build_dir} "
+        f"(from {os.path.getsize(args.parks_file)} bytes of parks JSON)"
+    )
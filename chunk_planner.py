@@ -0,0 +1,89 @@
+import math
+from functools import lru_cache
+
+import tiktoken
+
+from model_pricing import MODEL_PRICING, estimate_cost
+
+DEFAULT_MAX_INPUT_TOKENS = 4000
+DEFAULT_MAX_OUTPUT_TOKENS = 16384
+
+# Rewritten text tends to come back slightly longer than it went in
+DEFAULT_OUTPUT_RATIO = 1.1
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model='gpt-4o'):
+    # Loading an encoder is slow, so do it once per model
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(texts, model='gpt-4o'):
+    tokenizer = get_tokenizer(model)
+    return [len(tokenizer.encode(text)) for text in texts]
+
+
+def plan_chunks(description_tokens, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, overhead_tokens=0,
+                separator_tokens=0, output_ratio=DEFAULT_OUTPUT_RATIO, groups=None):
+    # Pack consecutive descriptions into chunks whose prompt fits
+    # max_input_tokens and whose expected reply fits max_output_tokens.
+    # Order is preserved so each reply maps straight back onto its parks.
+    # With groups (a group key per description, members next to each
+    # other), a chunk only ends early at a group boundary, so a group is
+    # split only when it doesn't fit in one chunk.
+    def chunk_tokens(sizes):
+        content = sum(sizes) + separator_tokens * max(len(sizes) - 1, 0)
+        return overhead_tokens + content, math.ceil(content * output_ratio)
+
+    def fits(sizes):
+        input_tokens, output_tokens = chunk_tokens(sizes)
+        return input_tokens <= max_input_tokens and output_tokens <= max_output_tokens
+
+    # Aim for evenly sized chunks instead of filling each one to the brim
+    # and leaving a small remainder at the end
+    budget = min(max_input_tokens - overhead_tokens, max_output_tokens / output_ratio)
+    total = sum(description_tokens) + separator_tokens * max(len(description_tokens) - 1, 0)
+    num_chunks = max(1, math.ceil(total / max(budget, 1)))
+    target = total / num_chunks
+
+    chunks = []
+    start = 0
+    for end in range(1, len(description_tokens) + 1):
+        sizes = description_tokens[start:end]
+        next_sizes = description_tokens[start:end + 1]
+        last = end == len(description_tokens)
+        boundary = last or groups is None or groups[end] != groups[end - 1]
+        if last or not fits(next_sizes) or (sum(sizes) >= target and boundary):
+            input_tokens, output_tokens = chunk_tokens(sizes)
+            chunks.append({
+                'start': start,
+                'end': end,
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                # A single description can be too big for the budget by itself
+                'oversized': not fits(sizes),
+            })
+            start = end
+    return chunks
+
+
+def print_plan(chunks, model='gpt-4o'):
+    print(f"{'chunk':>5}  {'items':>9}  {'input tok':>9}  {'output tok':>10}  {'est. cost':>9}")
+    total_input = total_output = 0
+    for idx, chunk in enumerate(chunks):
+        cost = estimate_cost(chunk['input_tokens'], chunk['output_tokens'], model)
+        flag = '  OVER BUDGET' if chunk['oversized'] else ''
+        print(
+            f"{idx + 1:>5}  {chunk['start'] + 1:>4}-{chunk['end']:<4}  {chunk['input_tokens']:>9}  "
+            f"{chunk['output_tokens']:>10}  {'n/a' if cost is None else f'${cost:.4f}':>9}{flag}"
+        )
+        total_input += chunk['input_tokens']
+        total_output += chunk['output_tokens']
+
+    cost = estimate_cost(total_input, total_output, model)
+    print(
+        f"Total: {len(chunks)} chunks, {total_input} input tokens, "
+        f"{total_output} estimated output tokens, "
+        f"{'unknown cost' if cost is None else f'~${cost:.4f}'} with {model}"
+    )
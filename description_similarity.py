@@ -0,0 +1,163 @@
+import argparse
+import json
+import re
+import sys
+
+import numpy as np
+from scipy import sparse
+
+# Descriptions are compared on overlapping runs of this many words
+SHINGLE_WORDS = 5
+# A shingle found in at least this many descriptions is a repeated phrase
+MIN_PHRASE_PARKS = 3
+# A description needs this many repeated phrases to be worth optimizing
+MIN_REPEATED_PHRASES = 2
+# Jaccard similarity of two descriptions' shingles that makes them a
+# near-duplicate pair, which is always optimized together
+MIN_PAIR_SIMILARITY = 0.1
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    # Set of lowercased word n-grams, ignoring punctuation
+    words = _WORD.findall(text.lower().replace('’', "'"))
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def shingle_matrix(texts, size=SHINGLE_WORDS):
+    # Sparse 0/1 matrix with a row per text and a column per distinct
+    # shingle, plus the shingle of every column
+    vocabulary = {}
+    columns, lengths = [], []
+    for text in texts:
+        row = [vocabulary.setdefault(shingle, len(vocabulary)) for shingle in shingles(text, size)]
+        columns.extend(row)
+        lengths.append(len(row))
+    rows = np.repeat(np.arange(len(texts)), lengths)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(columns), dtype=np.int32), (rows, columns)), shape=(len(texts), len(vocabulary))
+    )
+    return matrix, list(vocabulary)
+
+
+def similar_pairs(matrix, min_similarity=MIN_PAIR_SIMILARITY):
+    # (i, j, Jaccard similarity) of every pair of rows with i < j at or
+    # above min_similarity, most similar first. The shared shingle counts
+    # come from one sparse product, so only overlapping pairs are visited.
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    shared = sparse.triu(matrix @ matrix.T, k=1).tocoo()
+    union = sizes[shared.row] + sizes[shared.col] - shared.data
+    similarity = shared.data / np.maximum(union, 1)
+    keep = similarity >= min_similarity
+    order = np.lexsort((shared.col[keep], shared.row[keep], -similarity[keep]))
+    return [
+        (int(i), int(j), float(s))
+        for i, j, s in zip(shared.row[keep][order], shared.col[keep][order], similarity[keep][order])
+    ]
+
+
+def analyze_descriptions(texts, size=SHINGLE_WORDS, min_phrase_parks=MIN_PHRASE_PARKS,
+                         min_repeated_phrases=MIN_REPEATED_PHRASES, min_pair_similarity=MIN_PAIR_SIMILARITY):
+    # Find the phrases repeated across descriptions and the near-duplicate
+    # pairs, flag the descriptions worth sending to the optimizer and group
+    # the flagged ones into clusters. Each cluster is seeded by the most
+    # widespread repeated phrase its descriptions share, so a chunk of the
+    # optimizer sees every use of that phrase side by side.
+    matrix, vocabulary = shingle_matrix(texts, size)
+    parks = np.asarray(matrix.sum(axis=0)).ravel()
+    # Most widespread first, ties by phrase so the result doesn't depend on
+    # the order shingles were first seen in
+    repeated_columns = np.flatnonzero(parks >= min_phrase_parks)
+    if len(repeated_columns):
+        phrases = np.array([vocabulary[column] for column in repeated_columns])
+        repeated_columns = repeated_columns[np.lexsort((phrases, -parks[repeated_columns]))]
+
+    repeated = matrix[:, repeated_columns]
+    repeated_counts = np.asarray(repeated.sum(axis=1)).ravel()
+    pairs = similar_pairs(matrix, min_pair_similarity)
+
+    flagged = repeated_counts >= min_repeated_phrases
+    for i, j, _ in pairs:
+        flagged[i] = flagged[j] = True
+
+    # Every flagged description joins the cluster of the most widespread
+    # repeated phrase it contains (its lowest column in `repeated`), with the
+    # clusters in phrase order; the rest start out on their own
+    repeated.sort_indices()
+    has_phrase = np.diff(repeated.indptr) > 0
+    first = np.full(len(texts), -1)
+    if has_phrase.any():
+        first[has_phrase] = np.minimum.reduceat(repeated.indices, repeated.indptr[:-1][has_phrase])
+    seeded = flagged & has_phrase
+    seeds = np.unique(first[seeded])
+    cluster_of = np.full(len(texts), -1)
+    cluster_of[seeded] = np.searchsorted(seeds, first[seeded])
+    clusters = [{'phrase': vocabulary[repeated_columns[seed]], 'members': set()} for seed in seeds]
+    for index in np.flatnonzero(seeded).tolist():
+        clusters[cluster_of[index]]['members'].add(index)
+    for index in np.flatnonzero(flagged & (cluster_of == -1)):
+        cluster_of[index] = len(clusters)
+        clusters.append({'phrase': None, 'members': {int(index)}})
+
+    # Near-duplicates end up in the same cluster
+    for i, j, _ in pairs:
+        keep, merge = sorted((cluster_of[i], cluster_of[j]))
+        if keep != merge:
+            for index in clusters[merge]['members']:
+                cluster_of[index] = keep
+            clusters[keep]['members'] |= clusters[merge]['members']
+            clusters[merge]['members'] = set()
+
+    repeated_phrases = [vocabulary[column] for column in repeated_columns.tolist()]
+    description_phrases = [
+        [repeated_phrases[position] for position in repeated.indices[start:end].tolist()]
+        for start, end in zip(repeated.indptr[:-1].tolist(), repeated.indptr[1:].tolist())
+    ]
+
+    return {
+        'phrases': [(phrase, int(count)) for phrase, count in zip(repeated_phrases, parks[repeated_columns])],
+        'pairs': pairs,
+        'description_phrases': description_phrases,
+        'flagged': flagged,
+        'clusters': [
+            {'phrase': cluster['phrase'], 'members': sorted(cluster['members'])}
+            for cluster in clusters if cluster['members']
+        ],
+    }
+
+
+def print_analysis(analysis, names=None, limit=10):
+    flagged = analysis['flagged']
+    print(
+        f"Repetition analysis: {int(flagged.sum())} of {len(flagged)} descriptions flagged, "
+        f"{len(analysis['phrases'])} repeated phrases, {len(analysis['pairs'])} near-duplicate pairs, "
+        f"{len(analysis['clusters'])} clusters"
+    )
+    for phrase, parks in analysis['phrases'][:limit]:
+        print(f"  {parks:>4} descriptions: \"{phrase}\"")
+    for i, j, similarity in analysis['pairs'][:limit]:
+        label_i, label_j = (names[i], names[j]) if names is not None else (i, j)
+        print(f"  {similarity:.2f} similar: {label_i} / {label_j}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report repeated phrases and near-duplicate park descriptions')
+    parser.add_argument('input_file', nargs='?', default='updated_national_parks.json')
+    parser.add_argument('--limit', type=int, default=20,
+                        help='Number of phrases and pairs to list')
+    args = parser.parse_args()
+
+    try:
+        with open(args.input_file, 'r', encoding='utf-8') as file:
+            parks = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    names = [park['Name'] for park in parks]
+    analysis = analyze_descriptions([park['Description'] for park in parks])
+    print_analysis(analysis, names, args.limit)
+    for cluster in analysis['clusters']:
+        label = f"\"{cluster['phrase']}\"" if cluster['phrase'] else 'near-duplicates'
+        print(f"Cluster {label}: {', '.join(names[index] for index in cluster['members'])}")
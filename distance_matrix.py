@@ -0,0 +1,221 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+# Mean earth radius used by geopy's great_circle, converted to miles
+EARTH_RADIUS_MILES = 6371.009 / 1.609344
+
+# WGS-84 ellipsoid, same one geopy.distance.geodesic uses by default
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+METERS_PER_MILE = 1609.344
+
+# Largest error we accept when comparing against geopy's geodesic.
+# Haversine treats the earth as a sphere, which is off by up to ~0.56%.
+ERROR_BOUNDS = {
+    'haversine': {'relative': 0.0056},
+    'geodesic': {'absolute_miles': 1e-6},
+}
+
+
+def _as_points(points):
+    # Accept an (n, 2) array-like of (latitude, longitude) pairs
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def haversine_matrix(lats_a, lons_a, lats_b, lons_b):
+    # Broadcast every point in a against every point in b
+    lat1 = np.radians(np.asarray(lats_a, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons_a, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats_b, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(lons_b, dtype=float))[None, :]
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def geodesic_matrix(lats_a, lons_a, lats_b, lons_b, max_iterations=200, tolerance=1e-12):
+    # Every point in a against every point in b
+    return _vincenty(
+        np.asarray(lats_a, dtype=float)[:, None], np.asarray(lons_a, dtype=float)[:, None],
+        np.asarray(lats_b, dtype=float)[None, :], np.asarray(lons_b, dtype=float)[None, :],
+        max_iterations, tolerance
+    )
+
+
+def geodesic_pairs(lats_a, lons_a, lats_b, lons_b, max_iterations=200, tolerance=1e-12):
+    # Point i of a against point i of b only
+    return _vincenty(
+        np.asarray(lats_a, dtype=float), np.asarray(lons_a, dtype=float),
+        np.asarray(lats_b, dtype=float), np.asarray(lons_b, dtype=float),
+        max_iterations, tolerance
+    )
+
+
+def _vincenty(lats_a, lons_a, lats_b, lons_b, max_iterations, tolerance):
+    # Vectorized Vincenty inverse formula on the WGS-84 ellipsoid, for
+    # coordinate arrays in degrees that broadcast against each other
+    shape = np.broadcast_shapes(lats_a.shape, lons_a.shape, lats_b.shape, lons_b.shape)
+    lat1, lon1 = np.radians(lats_a), np.radians(lons_a)
+    lat2, lon2 = np.radians(lats_b), np.radians(lons_b)
+
+    f = WGS84_F
+    L = np.broadcast_to(lon2 - lon1, shape)
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt(
+                (cos_u2 * sin_lam) ** 2 +
+                (cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam) ** 2
+            )
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            # Coincident points have sin_sigma == 0
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+
+            # Equatorial lines have cos2_alpha == 0
+            cos_2sigma_m = np.where(
+                cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha
+            )
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (
+                    cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+                )
+            )
+            converged = np.abs(lam - lam_prev) < tolerance
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (
+            cos_2sigma_m + B / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+                B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+            )
+        )
+        miles = WGS84_B * A * (sigma - delta_sigma) / METERS_PER_MILE
+
+    # Vincenty fails to converge for nearly antipodal points, so hand those
+    # few pairs to geopy (Karney's algorithm) instead
+    nan_input = np.isnan(L) | np.isnan(U1) | np.isnan(U2)
+    lats_a, lons_a, lats_b, lons_b = np.broadcast_arrays(lats_a, lons_a, lats_b, lons_b)
+    for index in zip(*np.nonzero(~converged & ~nan_input)):
+        miles[index] = geodesic(
+            (lats_a[index], lons_a[index]), (lats_b[index], lons_b[index])
+        ).miles
+    miles[nan_input] = np.nan
+
+    return miles
+
+
+def distance_matrix(points_a, points_b, method='haversine'):
+    # Build the full len(points_a) x len(points_b) matrix of distances in miles
+    lats_a, lons_a = _as_points(points_a)
+    lats_b, lons_b = _as_points(points_b)
+
+    if method == 'haversine':
+        return haversine_matrix(lats_a, lons_a, lats_b, lons_b)
+    if method == 'geodesic':
+        return geodesic_matrix(lats_a, lons_a, lats_b, lons_b)
+    raise ValueError(f"Unknown distance method '{method}', expected 'haversine' or 'geodesic'")
+
+
+def check_against_geopy(points_a, points_b, matrix, method='haversine', sample_size=200, seed=0):
+    # Compare a random sample of matrix entries with geopy's geodesic and
+    # report whether the error stays within ERROR_BOUNDS for the method
+    lats_a, lons_a = _as_points(points_a)
+    lats_b, lons_b = _as_points(points_b)
+    matrix = np.asarray(matrix)
+
+    rng = np.random.default_rng(seed)
+    n_pairs = matrix.size
+    sample = rng.choice(n_pairs, size=min(sample_size, n_pairs), replace=False)
+
+    max_abs_error = 0.0
+    max_rel_error = 0.0
+    for flat_index in sample:
+        i, j = np.unravel_index(flat_index, matrix.shape)
+        if np.isnan(matrix[i, j]):
+            continue
+        expected = geodesic((lats_a[i], lons_a[i]), (lats_b[j], lons_b[j])).miles
+        abs_error = abs(matrix[i, j] - expected)
+        max_abs_error = max(max_abs_error, abs_error)
+        if expected > 0:
+            max_rel_error = max(max_rel_error, abs_error / expected)
+
+    bounds = ERROR_BOUNDS[method]
+    within_bound = (
+        max_rel_error <= bounds.get('relative', float('inf')) and
+        max_abs_error <= bounds.get('absolute_miles', float('inf'))
+    )
+
+    return {
+        'method': method,
+        'pairs_checked': len(sample),
+        'max_abs_error_miles': float(max_abs_error),
+        'max_rel_error': float(max_rel_error),
+        'within_bound': bool(within_bound),
+    }
+
+
+def check_methods(points_a, points_b, methods=('haversine', 'geodesic'), sample_size=200, seed=0):
+    # Build the matrix with each method and check a sample against geopy
+    return [
+        check_against_geopy(
+            points_a, points_b, distance_matrix(points_a, points_b, method), method, sample_size, seed
+        )
+        for method in methods
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Check park-to-airport distance matrices against geopy on a random sample'
+    )
+    parser.add_argument('--parks', default='national_parks.csv',
+                        help='CSV with Latitude and Longitude columns')
+    parser.add_argument('--airports', default='iata-icao.csv',
+                        help='CSV with latitude and longitude columns')
+    parser.add_argument('--method', action='append', dest='methods', choices=sorted(ERROR_BOUNDS),
+                        help='Method to check, can be repeated (default: all)')
+    parser.add_argument('--sample-size', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    parks_df = pd.read_csv(args.parks).dropna(subset=['Latitude', 'Longitude'])
+    airports_df = pd.read_csv(args.airports).dropna(subset=['latitude', 'longitude'])
+
+    results = check_methods(
+        parks_df[['Latitude', 'Longitude']].to_numpy(), airports_df[['latitude', 'longitude']].to_numpy(),
+        args.methods or sorted(ERROR_BOUNDS), args.sample_size, args.seed
+    )
+    for result in results:
+        status = 'ok' if result['within_bound'] else 'OUT OF BOUNDS'
+        print(
+            f"{result['method']}: {result['pairs_checked']} pairs, "
+            f"max error {result['max_abs_error_miles']:.3g} miles ({result['max_rel_error']:.3%}) {status}"
+        )
+
+    if not all(result['within_bound'] for result in results):
+        sys.exit(1)
@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import unicodedata
+
+DEFAULT_NAME_FIELDS = ('name', 'Name')
+
+# Quotes are dropped and every kind of dash becomes an underscore, in one
+# str.translate call instead of a regex pass each
+_TRANSLATE_TABLE = str.maketrans({
+    '"': None, '″': None, "'": None, 'ʻ': None,
+    '-': '_', '–': '_', '—': '_',
+})
+
+_WHITESPACE = re.compile(r'[\s ]+')
+_NON_WORD = re.compile(r'[^\w\s]')
+
+# For plain ASCII names whitespace runs and punctuation are handled in a
+# single substitution
+_WHITESPACE_OR_NON_WORD = re.compile(r'(\s+)|[^\w\s]')
+
+
+def _replace_ascii(match):
+    return '_' if match.group(1) else ''
+
+
+def generate_id(name):
+    # Lowercase, drop quotes, turn dashes and whitespace into underscores,
+    # strip accents and remove any remaining punctuation
+    id_string = name.lower().translate(_TRANSLATE_TABLE)
+
+    if id_string.isascii():
+        return _WHITESPACE_OR_NON_WORD.sub(_replace_ascii, id_string)
+
+    id_string = _WHITESPACE.sub('_', id_string)
+    id_string = ''.join(
+        c for c in unicodedata.normalize('NFKD', id_string)
+        if not unicodedata.combining(c)
+    )
+    return _NON_WORD.sub('', id_string)
+
+
+def find_name_field(item, fields=DEFAULT_NAME_FIELDS):
+    return next((field for field in fields if field in item), None)
+
+
+def load_id_map(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_id_map(id_map, path):
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(id_map, file, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+class IdAssigner:
+    # Hands out unique ids one name at a time. Names already in id_map keep
+    # their id, so ids stay stable across runs. A new name whose id is taken
+    # gets the first free numeric suffix (_2, _3, ...). Entities that share
+    # the exact same name are told apart in id_map by a "#n" occurrence suffix.
+
+    def __init__(self, id_map=None):
+        self.id_map = dict(id_map or {})
+        self.used = set(self.id_map.values())
+        self.occurrences = {}
+        self.collisions = {}
+
+    def assign(self, name):
+        occurrence = self.occurrences.get(name, 0) + 1
+        self.occurrences[name] = occurrence
+        key = name if occurrence == 1 else f"{name}#{occurrence}"
+
+        if key in self.id_map:
+            return self.id_map[key]
+
+        base_id = generate_id(name)
+        new_id = base_id
+        suffix = 2
+        while new_id in self.used:
+            new_id = f"{base_id}_{suffix}"
+            suffix += 1
+
+        if new_id != base_id:
+            self.collisions.setdefault(base_id, []).append((name, new_id))
+        self.used.add(new_id)
+        self.id_map[key] = new_id
+        return new_id
+
+    def collision_report(self):
+        # List of {'id', 'names': [(name, assigned id), ...]} for every base id
+        # that more than one name mapped to
+        return [
+            {'id': base_id, 'names': names}
+            for base_id, names in sorted(self.collisions.items())
+        ]
+
+
+def generate_ids(names, id_map=None):
+    # Batch version: returns (ids, collision report, updated id map)
+    assigner = IdAssigner(id_map)
+    ids = [assigner.assign(name) for name in names]
+    return ids, assigner.collision_report(), assigner.id_map
+
+
+def print_collision_report(report):
+    for collision in report:
+        renamed = ', '.join(f"'{name}' -> {new_id}" for name, new_id in collision['names'])
+        print(f"Id collision on '{collision['id']}': {renamed}")
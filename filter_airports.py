@@ -1,138 +1,125 @@
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
-
-# Read the CSV files
-airports_df = pd.read_csv('airports_1.csv')
-iata_icao_df = pd.read_csv('iata-icao.csv')
-gpt_suggested_df = pd.read_csv('GPT_Suggested_National_Parks_Airports.csv')
-
-print("After initial load:")
-print("HNL in airports_df IATA:", 'HNL' in airports_df['IATA'].values)
-print("HNL in iata_icao_df iata:", 'HNL' in iata_icao_df['iata'].values)
-
-# Read national parks data and get coordinates
-parks_df = pd.read_csv('national_parks.csv')
-park_coordinates = parks_df[['Latitude', 'Longitude']].values
-
-# Get list of suggested airport codes
-suggested_codes = gpt_suggested_df['Code'].dropna().unique()
-
-# Filter airports_df to include rows where:
-# 1. Role contains L, M, or S OR
-# 2. IATA matches a suggested airport code OR
-# 3. Airport name contains "International"
-airports_filtered = airports_df[
-    (airports_df['Role'].str.contains('L|M|S', na=False)) |
-    (airports_df['IATA'].isin(suggested_codes)) |
-    (airports_df['Airport'].str.contains('International', case=False, na=False))
-]
-
-
-
-print("\nAfter airports_filtered:")
-print("HNL in airports_filtered IATA:", 'HNL' in airports_filtered['IATA'].values)
-
-# Get list of IATA codes from filtered airports
-valid_iata_codes = airports_filtered['IATA'].dropna().unique()
-
-# Filter iata_icao_df to only include rows where iata matches valid codes
-iata_icao_filtered = iata_icao_df[
-    iata_icao_df['iata'].isin(valid_iata_codes)
-]
-
-print("\nAfter iata_icao_filtered:")
-print("HNL in iata_icao_filtered iata:", 'HNL' in iata_icao_filtered['iata'].values)
-
-# Merge the filtered dataframes
-merged_airports = airports_filtered.merge(
-    iata_icao_filtered,
-    left_on='IATA',
-    right_on='iata',
-    how='left'
-)
-
-print("\nAfter merge:")
-print("HNL in merged_airports iata:", 'HNL' in merged_airports['iata'].values)
-
-# For rows where 'Airport' contains 'International' but 'airport' doesn't,
-# set 'airport' equal to 'Airport'
-international_mask = (
-    merged_airports['Airport'].str.contains('International', case=False, na=False) &
-    ~merged_airports['airport'].str.contains('International', case=False, na=False)
-)
-merged_airports.loc[international_mask, 'airport'] = merged_airports.loc[international_mask, 'Airport']
-
-# Drop specified columns and rename 'airport' to 'airport_name'
-columns_to_drop = ['Airport', 'ICAO', 'icao', 'FAA', 'iata']
-merged_airports = merged_airports.drop(columns=columns_to_drop, errors='ignore')
-merged_airports = merged_airports.rename(columns={'airport': 'airport_name'})
-
-# Convert all column names to lowercase
-merged_airports.columns = merged_airports.columns.str.lower()
-
-# Cast enplanements to int, replacing any non-numeric values with NaN first
-merged_airports['enplanements'] = pd.to_numeric(merged_airports['enplanements'], errors='coerce').astype('Int64')
-
-# Create df of airports not in suggested_codes
-non_suggested_airports = merged_airports[~merged_airports['iata'].isin(suggested_codes)].copy()
-
-# Initialize list to store IATA codes of airports to exclude
-iatas_to_exclude = []
-
-# For each airport not in suggested_codes
-for idx, airport in non_suggested_airports.iterrows():
-    airport_point = (airport['latitude'], airport['longitude'])
-    
-    # Calculate minimum distance to any park
-    min_distance = float('inf')
-    for park_point in park_coordinates:
-        distance = geodesic(airport_point, park_point).miles
-        min_distance = min(min_distance, distance)
-    
-    # If no park is within 500 miles, add to exclusion list
-    if min_distance > 500:
-        iatas_to_exclude.append(airport['iata'])
-
-# Filter out airports that are too far from any park
-merged_airports = merged_airports[~merged_airports['iata'].isin(iatas_to_exclude)]
-
-print("\nAfter distance filtering:")
-print("HNL in merged_airports iata:", 'HNL' in merged_airports['iata'].values)
-
-# Create set to store closest airport codes
-closest_airports = set()
-
-# For each park, find 3 closest airports
-for park_point in park_coordinates:
-    # Create list to store (distance, iata) tuples
-    distances = []
-    
-    # Calculate distance to each airport
-    for idx, airport in merged_airports.iterrows():
-        airport_point = (airport['latitude'], airport['longitude'])
-        distance = geodesic(park_point, airport_point).miles
-        distances.append((distance, airport['iata']))
-    
-    # Sort by distance and get 3 closest
-    distances.sort()
-    closest_three = distances[:4]
-    
-    # Add IATA codes to set
-    for _, iata in closest_three:
-        if pd.notna(iata):  # Only add if IATA code is not NaN
-            closest_airports.add(iata)
-
-# Keep only airports that are either closest to a park or in suggested_codes
-merged_airports = merged_airports[
-    merged_airports['iata'].isin(closest_airports) |
-    merged_airports['iata'].isin(suggested_codes)
-]
-
-print("\nAfter closest airports filtering:")
-if 'HNL' in closest_airports:
-    print("HNL is in closest_airports set")
-print("HNL in final merged_airports iata:", 'HNL' in merged_airports['iata'].values)
-
-# Save merged dataframe to CSV
-merged_airports.to_csv('filtered_airports.csv', index=False)
-iata_icao_filtered.to_csv('filtered_iata_icao.csv', index=False)
+
+from airport_index import SphereIndex
+from entity_ids import generate_ids
+from park_airports import LOOKUP_PATH, build_park_airports
+from pipeline_io import load_table, save_records, save_table
+from reference_data import load_airport_reference
+from telemetry import telemetry
+
+# Only these columns of each table make it into filtered_airports.csv;
+# 'iata' on the right is the join key and is dropped after the merge
+AIRPORT_COLUMNS = ['City', 'IATA', 'Airport', 'Role', 'Enplanements']
+REFERENCE_COLUMNS = ['country_code', 'region_name', 'iata', 'airport', 'latitude', 'longitude']
+
+
+def filter_airports(airports_df, iata_icao_df, parks_df, suggested_codes, max_park_miles=500, nearest_per_park=4):
+    # Keep the airports worth showing next to the parks: hubs, international
+    # airports and suggested airports, joined with their coordinates, then
+    # narrowed to the ones near a park. Returns the filtered airports, the
+    # matching iata-icao rows and each park's nearest IATA codes in the
+    # order of parks_df.
+    suggested_codes = pd.unique(pd.Series(suggested_codes).dropna())
+
+    # Each test runs once over the column it needs:
+    # 1. Role contains L, M, or S OR
+    # 2. IATA matches a suggested airport code OR
+    # 3. Airport name contains "International"
+    is_hub = airports_df['Role'].str.contains('L|M|S', na=False).values
+    is_suggested = airports_df['IATA'].isin(suggested_codes).values
+    is_international = airports_df['Airport'].str.contains('International', case=False, na=False).values
+    keep = is_hub | is_suggested | is_international
+    airports_filtered = airports_df.loc[keep, AIRPORT_COLUMNS].assign(
+        _suggested=is_suggested[keep], _international=is_international[keep]
+    )
+    telemetry.rows('role/suggested/international filter', len(airports_df), len(airports_filtered))
+
+    # Filter iata_icao_df to only include rows where iata matches valid codes
+    iata_icao_filtered = iata_icao_df[
+        iata_icao_df['iata'].isin(airports_filtered['IATA'].dropna().unique())
+    ]
+    telemetry.rows('iata-icao filter', len(iata_icao_df), len(iata_icao_filtered))
+
+    merged_airports = airports_filtered.merge(
+        iata_icao_filtered[REFERENCE_COLUMNS],
+        left_on='IATA',
+        right_on='iata',
+        how='left'
+    )
+    telemetry.rows('merge with iata-icao', len(airports_filtered), len(merged_airports))
+
+    # Where 'Airport' says International but 'airport' doesn't, use 'Airport'
+    international = merged_airports['_international'].values & ~merged_airports['airport'].str.contains(
+        'International', case=False, na=False
+    ).values
+    merged_airports.loc[international, 'airport'] = merged_airports.loc[international, 'Airport']
+
+    is_suggested = merged_airports['_suggested'].values
+    merged_airports = merged_airports.drop(columns=['Airport', 'iata', '_suggested', '_international'])
+    merged_airports = merged_airports.rename(columns={'airport': 'airport_name'})
+    merged_airports.columns = merged_airports.columns.str.lower()
+
+    # Cast enplanements to int, replacing any non-numeric values with NaN first
+    merged_airports['enplanements'] = pd.to_numeric(merged_airports['enplanements'], errors='coerce').astype('Int64')
+
+    with telemetry.stage('distance filter'):
+        # Airports not suggested with no park within max_park_miles get
+        # excluded; airports without coordinates are kept
+        park_index = SphereIndex(parks_df['Latitude'], parks_df['Longitude'])
+        latitudes = merged_airports['latitude'].values.astype(float)
+        near_park = park_index.any_within(latitudes, merged_airports['longitude'].values, max_park_miles)
+        too_far = ~is_suggested & ~np.isnan(latitudes) & ~near_park
+
+    telemetry.rows(f'within {max_park_miles} miles of a park', len(merged_airports), int((~too_far).sum()))
+    merged_airports = merged_airports[~too_far]
+    is_suggested = is_suggested[~too_far]
+
+    with telemetry.stage('closest airports'):
+        # Each park's nearest airports, ties broken by IATA code
+        codes = merged_airports['iata'].values
+        airport_index = SphereIndex(
+            merged_airports['latitude'], merged_airports['longitude'], tie_breaker=codes
+        )
+        park_nearest_codes = [
+            [code for code in codes[positions] if pd.notna(code)]
+            for _, positions in airport_index.nearest_many(
+                parks_df['Latitude'], parks_df['Longitude'], k=nearest_per_park
+            )
+        ]
+        closest = [code for nearest in park_nearest_codes for code in nearest]
+
+    # Keep only airports that are either closest to a park or suggested
+    keep = is_suggested | merged_airports['iata'].isin(closest).values
+    telemetry.rows('closest to a park or suggested', len(merged_airports), int(keep.sum()))
+    return merged_airports[keep], iata_icao_filtered, park_nearest_codes
+
+
+if __name__ == "__main__":
+    # Read the CSV files
+    with telemetry.stage('load'):
+        airports_df = load_table('airports_1.csv')
+        reference = load_airport_reference('iata-icao.csv')
+        iata_icao_df = reference.airports
+        gpt_suggested_df = pd.read_csv('GPT_Suggested_National_Parks_Airports.csv')
+        parks_df = pd.read_csv('national_parks.csv')
+
+    merged_airports, iata_icao_filtered, park_nearest_codes = filter_airports(
+        airports_df, iata_icao_df, parks_df, gpt_suggested_df['Code']
+    )
+
+    # Save merged dataframe to CSV
+    with telemetry.stage('save'):
+        save_table(merged_airports, 'filtered_airports.csv')
+        save_table(iata_icao_filtered, 'filtered_iata_icao.csv')
+
+    # Keep each park's ranked airports, keyed by the same ids add_ids_to_json
+    # gives the parks, so the app can look them up instead of computing distances
+    with telemetry.stage('park airports'):
+        park_ids, _, _ = generate_ids(parks_df['Name'].tolist())
+        park_airports = build_park_airports(
+            parks_df, park_ids, park_nearest_codes, merged_airports, gpt_suggested_df, reference
+        )
+        save_records(park_airports, LOOKUP_PATH, ensure_ascii=False)
+
+    telemetry.print_summary()
@@ -1,42 +1,258 @@
-from openai import OpenAI
-from dotenv import load_dotenv
 import os
+import re
+import sys
+import json
+import argparse
 import pandas as pd
-from io import StringIO
 
-# Load environment variables from .env file
-load_dotenv()
+from entity_ids import generate_ids
+from llm_batch import LocalBatchTransport, OpenAIBatchTransport, run_batch
+from llm_cache import DEFAULT_CACHE_PATH, CachedClient, ResponseCache
+from llm_client import DEFAULT_BACKEND, LLMClient, backend_path
+from llm_concurrency import RateLimitedClient, RateLimiter, call_with_backoff, run_concurrently
+from llm_stub import climate_table_responder
+from pipeline_io import load_table, save_table
+from run_journal import RunJournal
+from telemetry import telemetry
 
-# Set up OpenAI API key from environment variable
-api_key = os.getenv('GPT_API_KEY')
-client = OpenAI(api_key=api_key)
+CLIMATE_MODEL = "chatgpt-4o-latest"
+OUTPUT_PATH = 'park_climate.csv'
+BATCH_PATH = 'temperature_batch.jsonl'
+# Holds the id of a submitted --batch job so --resume polls it again
+JOURNAL_PATH = 'temperature_journal.jsonl'
+COLUMNS = ['park_id', 'month', 'high_f', 'low_f']
 
-# Define the prompt
-prompt = """You are a data api that takes descriptive language input, searches the web across multiple sources, and returns the most accurate data formatted in a plain text data table, with no other extraneous information, titles, context, sources, or responses. Units of measurement can be in the column names, but should not be in the data rows themselves. Prefer official, governmental, and/or well-respected sources.
+MONTHS = [
+    'january', 'february', 'march', 'april', 'may', 'june',
+    'july', 'august', 'september', 'october', 'november', 'december'
+]
 
-Return a data table of the average monthly high and low temperatures in Fahrenheit for Kobuk Valley National Park."""
+# Matches numbers like -6, 12.5 or −22 (unicode minus), ignoring any °F suffix
+NUMBER_PATTERN = re.compile(r'[-−–]?\d+(?:\.\d+)?')
 
-# Make the API call
-completion = client.chat.completions.create(
-    model="chatgpt-4o-latest",
-    store=True,
-    messages=[
-        {"role": "user", "content": prompt}
+class ClimateTableError(Exception):
+    pass
+
+def build_climate_messages(park_name):
+    prompt = f"""You are a data api that takes descriptive language input, searches the web across multiple sources, and returns the most accurate data formatted in a plain text data table, with no other extraneous information, titles, context, sources, or responses. Units of measurement can be in the column names, but should not be in the data rows themselves. Prefer official, governmental, and/or well-respected sources.
+
+Return a data table of the average monthly high and low temperatures in Fahrenheit for {park_name} National Park, with one row per month and the columns Month, Avg High (°F) and Avg Low (°F)."""
+    return [{"role": "user", "content": prompt}]
+
+def _split_row(line):
+    # Split a table row written with pipes, tabs or commas into stripped cells
+    line = line.strip().strip('|')
+    for separator in ('|', '\t', ','):
+        if separator in line:
+            return [cell.strip() for cell in line.split(separator)]
+    return line.split()
+
+def _parse_number(cell):
+    match = NUMBER_PATTERN.search(cell.replace(',', ''))
+    if match is None:
+        return None
+    return float(match.group().replace('−', '-').replace('–', '-'))
+
+def _month_number(cell):
+    # Accept full names and abbreviations like "Jan" or "Sept."
+    cell = cell.strip().strip('*').rstrip('.').lower()
+    if len(cell) < 3:
+        return None
+    for number, month in enumerate(MONTHS, start=1):
+        if month.startswith(cell):
+            return number
+    return None
+
+def parse_climate_table(table_text):
+    # Turn a model reply into rows of (month, high_f, low_f). Tolerates
+    # markdown pipes, separator rows, code fences, extra columns and units.
+    high_col = low_col = None
+    rows = {}
+
+    for line in table_text.splitlines():
+        if not line.strip() or line.strip().startswith('```'):
+            continue
+        cells = _split_row(line)
+
+        # Markdown separator rows contain nothing but dashes and colons
+        if all(re.fullmatch(r':?-{2,}:?', cell) or not cell for cell in cells):
+            continue
+
+        month_idx = next((i for i, cell in enumerate(cells) if _month_number(cell)), None)
+        if month_idx is None:
+            # Header row: locate the high and low columns by name
+            lowered = [cell.lower() for cell in cells]
+            high_col = next((i for i, cell in enumerate(lowered) if 'high' in cell or 'max' in cell), high_col)
+            low_col = next((i for i, cell in enumerate(lowered) if 'low' in cell or 'min' in cell), low_col)
+            continue
+
+        month = _month_number(cells[month_idx])
+        if high_col is not None and low_col is not None and max(high_col, low_col) < len(cells):
+            high, low = _parse_number(cells[high_col]), _parse_number(cells[low_col])
+        else:
+            # No usable header: take the first two numbers after the month
+            numbers = [n for n in (_parse_number(cell) for cell in cells[month_idx + 1:]) if n is not None]
+            high, low = (numbers + [None, None])[:2]
+
+        if high is None or low is None:
+            raise ClimateTableError(f"missing temperatures in row: {line.strip()}")
+        # Some sources list the columns the other way around
+        rows[month] = (max(high, low), min(high, low))
+
+    if sorted(rows) != list(range(1, 13)):
+        missing = [MONTHS[m - 1] for m in range(1, 13) if m not in rows]
+        raise ClimateTableError(f"table is missing months: {', '.join(missing) or 'none parsed'}")
+
+    return [(month, high, low) for month, (high, low) in sorted(rows.items())]
+
+def climate_rows(park_id, table_text):
+    return pd.DataFrame(
+        [(park_id, month, high, low) for month, high, low in parse_climate_table(table_text)],
+        columns=COLUMNS
+    )
+
+def load_parks(parks_path):
+    # Return (park_id, park_name) pairs, generating ids when the file has none.
+    # Ids are assigned over the whole file like add_ids_to_json does, so
+    # colliding names get the same suffixes and the output joins on them.
+    with open(parks_path, 'r', encoding='utf-8') as file:
+        parks_data = json.load(file)
+    names = [park.get('Name') or park.get('name') for park in parks_data]
+    generated, _, _ = generate_ids(names)
+    return [(park.get('id') or park_id, name) for park, park_id, name in zip(parks_data, generated, names)]
+
+def load_collected(output_path):
+    if not os.path.exists(output_path):
+        return pd.DataFrame(columns=COLUMNS)
+    return load_table(output_path)
+
+def fetch_climate(client, park_id, park_name):
+    messages = build_climate_messages(park_name)
+
+    def request():
+        return client.chat.completions.create(model=CLIMATE_MODEL, store=True, messages=messages)
+
+    try:
+        completion = call_with_backoff(request)
+        rows = climate_rows(park_id, completion.choices[0].message.content)
+        print(f"Collected climate data for {park_name}")
+        return rows
+    except Exception as e:
+        # A reply we can't parse would otherwise be served from the cache forever
+        discard = getattr(client, 'discard', None)
+        if isinstance(e, ClimateTableError) and discard is not None:
+            discard(model=CLIMATE_MODEL, store=True, messages=messages)
+        print(f"Error getting climate data for {park_name}: {e}")
+        return None
+
+def collect_climate_data(client, parks, concurrency=4):
+    return run_concurrently(lambda park: fetch_climate(client, park[0], park[1]), parks, max_workers=concurrency)
+
+def collect_climate_batch(transport, parks, poll_interval=60, journal=None):
+    requests = [
+        (park_id, {"model": CLIMATE_MODEL, "store": True, "messages": build_climate_messages(park_name)})
+        for park_id, park_name in parks
     ]
-)
+    results, errors = run_batch(transport, requests, BATCH_PATH, poll_interval, journal=journal)
+
+    collected = []
+    for park_id, park_name in parks:
+        try:
+            if park_id not in results:
+                raise ClimateTableError(errors.get(park_id, 'no result'))
+            collected.append(climate_rows(park_id, results[park_id]))
+        except ClimateTableError as e:
+            print(f"Error getting climate data for {park_name}: {e}")
+    return collected
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect monthly climate data for every national park')
+    parser.add_argument('--parks', default='national_parks.json',
+                        help='Parks JSON file to collect climate data for')
+    parser.add_argument('--output',
+                        help=f'Long-format CSV of park_id, month, high_f, low_f (default: {OUTPUT_PATH})')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Collect every park again instead of skipping ones already in the output')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Number of parks to request at once')
+    parser.add_argument('--rpm', type=int, default=60,
+                        help='Requests-per-minute budget for API calls (not applied with --stub)')
+    parser.add_argument('--tpm', type=int, default=30000,
+                        help='Tokens-per-minute budget for API calls (not applied with --stub)')
+    parser.add_argument('--stub', action='store_true',
+                        help='Use a local stub client instead of the OpenAI API')
+    parser.add_argument('--cache-path',
+                        help=f'SQLite file used to cache API responses (default: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--batch', action='store_true',
+                        help='Submit the requests through the Batch API')
+    parser.add_argument('--batch-dir',
+                        help='Run --batch against a local file-based stand-in in this directory')
+    parser.add_argument('--batch-poll-interval', type=int, default=60,
+                        help='Seconds between batch status checks')
+    parser.add_argument('--resume', action='store_true',
+                        help='Pick up the batch submitted by an interrupted --batch run instead of paying for a new one')
+    args = parser.parse_args()
+
+    # A stub run writes its made-up temperatures to its own output and cache,
+    # so a later real run doesn't skip those parks as already collected
+    backend = 'stub' if args.stub else DEFAULT_BACKEND
+    output_path = args.output or backend_path(OUTPUT_PATH, backend)
+    cache_path = args.cache_path or backend_path(DEFAULT_CACHE_PATH, backend)
+
+    # Record latency, tokens and cost of every call that reaches the API
+    if args.stub:
+        llm = LLMClient('stub', telemetry=telemetry, latency=0.2, responder=climate_table_responder)
+    else:
+        llm = LLMClient('openai', telemetry=telemetry)
 
-# Get the response
-table_text = completion.choices[0].message.content
-print(table_text)
+    failed = 0
+    # Skip parks that are already in the output
+    collected = pd.DataFrame(columns=COLUMNS) if args.refresh else load_collected(output_path)
+    done = set(collected['park_id'])
+    parks = [park for park in load_parks(args.parks) if park[0] not in done]
+    print(f"{len(done)} parks already collected, {len(parks)} to fetch")
 
-# Convert the text table to a pandas DataFrame
-df = pd.read_csv(StringIO(table_text), sep='|', engine='python')
+    if parks:
+        if args.batch or args.batch_dir:
+            if args.batch_dir:
+                transport = LocalBatchTransport(args.batch_dir, llm.client)
+            else:
+                transport = OpenAIBatchTransport(llm.client)
+            journal = RunJournal(backend_path(JOURNAL_PATH, backend), resume=args.resume)
+            with telemetry.stage('batch collect'):
+                results = collect_climate_batch(transport, parks, args.batch_poll_interval, journal)
+        else:
+            # Serve repeated prompts from the on-disk response cache; only
+            # calls that miss it wait on the rate limit, and the stub has no
+            # quota to respect
+            if args.stub:
+                limited = llm
+            else:
+                limiter = RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+                limited = RateLimitedClient(llm, limiter, max_completion_tokens=300)
+            client = CachedClient(limited, ResponseCache(cache_path))
+            with telemetry.stage('collect'):
+                results = collect_climate_data(client, parks, args.concurrency)
+            llm.print_stats()
+            client.print_stats()
+            telemetry.cache_stats(client.cache.stats())
 
-# Clean up whitespace in column names and values
-df.columns = [col.strip() for col in df.columns]
-df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+        new_rows = [rows for rows in results if rows is not None]
+        if new_rows:
+            frames = ([collected] if len(collected) else []) + new_rows
+            collected = pd.concat(frames, ignore_index=True)
+        print(f"Collected {len(new_rows)} of {len(parks)} parks")
+        failed = len(parks) - len(new_rows)
 
-# Save to CSV
-df.to_csv('kobuk_valley_temperatures.csv', index=False)
+    # Save to CSV
+    collected = collected.sort_values(['park_id', 'month']).reset_index(drop=True)
+    save_table(collected, output_path)
+    print(f"Data has been saved to {output_path}")
+    telemetry.print_summary()
+    if failed:
+        # Exit non-zero so pipeline.py doesn't record the run as current
+        print(f"No climate data for {failed} parks, rerun to retry them")
+        sys.exit(1)
 
-print("Data has been saved to kobuk_valley_temperatures.csv") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
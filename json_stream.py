@@ -0,0 +1,74 @@
+import json
+
+WHITESPACE = ' \t\r\n'
+# Characters a number can continue with after the part that already decodes
+NUMBER_CONTINUATION = '.eE+-'
+
+
+class NotAJsonArrayError(ValueError):
+    pass
+
+
+def iter_json_array(file_path, chunk_size=1 << 16):
+    # Yield the elements of a top-level JSON array one at a time, holding
+    # only the current element (plus one read chunk) in memory
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer = ''
+        pos = 0
+        eof = False
+        read_size = chunk_size
+
+        def refill():
+            # Drop what has been consumed and read the next chunk
+            nonlocal buffer, pos, eof
+            data = file.read(read_size)
+            if not data:
+                eof = True
+            buffer = buffer[pos:] + data
+            pos = 0
+
+        def next_char():
+            # Skip whitespace and return the next character, or '' at end of file
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return buffer[pos] if pos < len(buffer) else ''
+                refill()
+
+        if next_char() != '[':
+            raise NotAJsonArrayError(f"'{file_path}' does not contain a top-level JSON array")
+        pos += 1
+
+        if next_char() == ']':
+            return
+
+        while True:
+            next_char()
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A number at the very end of the buffer may continue in the
+                # next chunk, including one cut off right after its '.', 'e'
+                # or exponent sign ('1.' decodes as 1 and leaves the '.')
+                if not eof and not buffer[end:].strip(NUMBER_CONTINUATION):
+                    raise json.JSONDecodeError('Value may be incomplete', buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The element doesn't fit in the buffer yet, so read more,
+                # growing the read size for very large elements
+                refill()
+                read_size = min(read_size * 2, 1 << 26)
+                continue
+            read_size = chunk_size
+            pos = end
+            yield value
+
+            separator = next_char()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            pos += 1
@@ -1,55 +1,105 @@
 import json
 import csv
 import sys
-import json
+import argparse
+from itertools import islice
+
+from json_stream import NotAJsonArrayError, iter_json_array
+from telemetry import telemetry
+
+def flatten_item(item, parent_key=''):
+    # Turn nested objects into dotted columns, e.g. {"a": {"b": 1}} -> {"a.b": 1}
+    row = {}
+    for key, value in item.items():
+        column = f"{parent_key}.{key}" if parent_key else key
+        if isinstance(value, dict) and value:
+            row.update(flatten_item(value, column))
+        else:
+            row[column] = value
+    return row
+
+def to_row(item, flatten=False):
+    if not isinstance(item, dict):
+        raise ValueError("JSON file must contain a list of objects")
+    if flatten:
+        item = flatten_item(item)
+
+    # Convert nested objects/lists to strings
+    row = {}
+    for key, value in item.items():
+        if isinstance(value, (dict, list)):
+            row[key] = json.dumps(value)
+        else:
+            row[key] = value
+    return row
+
+def collect_fieldnames(json_file_path, flatten=False, sample_size=None):
+    # First pass: union of the keys of every object (or the first
+    # sample_size objects), in the order they are first seen
+    fieldnames = {}
+    items = iter_json_array(json_file_path)
+    if sample_size is not None:
+        items = islice(items, sample_size)
+    for item in items:
+        for key in to_row(item, flatten):
+            fieldnames.setdefault(key, None)
+    return list(fieldnames)
+
+def json_to_csv(json_file_path, csv_file_path=None, flatten=False, sample_size=None):
+    # Create CSV filename from JSON filename
+    if csv_file_path is None:
+        csv_file_path = json_file_path.rsplit('.', 1)[0] + '.csv'
 
-def json_to_csv(json_file_path):
-    # Read JSON file
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        fieldnames = collect_fieldnames(json_file_path, flatten, sample_size)
     except FileNotFoundError:
         print(f"Error: File '{json_file_path}' not found.")
         sys.exit(1)
     except json.JSONDecodeError:
         print(f"Error: '{json_file_path}' is not a valid JSON file.")
         sys.exit(1)
-
-    if not data or not isinstance(data, list):
+    except (NotAJsonArrayError, ValueError):
         print("Error: JSON file must contain a list of objects.")
         sys.exit(1)
 
-    # Get field names from the first object
-    fieldnames = list(data[0].keys())
-
-    # Create CSV filename from JSON filename
-    csv_file_path = json_file_path.rsplit('.', 1)[0] + '.csv'
+    if not fieldnames:
+        print("Error: JSON file must contain a list of objects.")
+        sys.exit(1)
 
-    # Write to CSV
+    # Second pass: stream the objects straight into the CSV
     try:
+        rows_written = 0
+        dropped_keys = set()
         with open(csv_file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
             writer.writeheader()
-            
-            for item in data:
-                # Convert nested objects/lists to strings
-                row = {}
-                for key, value in item.items():
-                    if isinstance(value, (dict, list)):
-                        row[key] = json.dumps(value)
-                    else:
-                        row[key] = value
+
+            known = set(fieldnames)
+            for item in iter_json_array(json_file_path):
+                row = to_row(item, flatten)
+                # Only possible when the schema came from a sample
+                dropped_keys.update(key for key in row if key not in known)
                 writer.writerow(row)
-        
-        print(f"Successfully converted {json_file_path} to {csv_file_path}")
+                rows_written += 1
+
+        if dropped_keys:
+            print(f"Warning: columns not in the sampled schema were dropped: {sorted(dropped_keys)}")
+        print(f"Successfully converted {json_file_path} to {csv_file_path} "
+              f"({rows_written} rows, {len(fieldnames)} columns)")
 
     except IOError as e:
         print(f"Error writing to CSV file: {e}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python json_to_csv.py <json_file_path>")
-        sys.exit(1)
-    
-    json_to_csv(sys.argv[1])
+    parser = argparse.ArgumentParser(description='Convert a JSON list of objects to CSV')
+    parser.add_argument('json_file_path')
+    parser.add_argument('--output', help='CSV file to write (default: next to the JSON file)')
+    parser.add_argument('--flatten', action='store_true',
+                        help='Flatten nested objects into dotted columns')
+    parser.add_argument('--sample', type=int,
+                        help='Build the column list from only the first N objects')
+    args = parser.parse_args()
+
+    with telemetry.stage('convert'):
+        json_to_csv(args.json_file_path, args.output, args.flatten, args.sample)
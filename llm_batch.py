@@ -0,0 +1,167 @@
+import json
+import os
+import time
+import uuid
+
+from run_journal import unit_id
+
+CHAT_COMPLETIONS_URL = '/v1/chat/completions'
+
+# Batch states after which polling can stop
+FINISHED_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+def write_batch_file(path, requests):
+    # requests is a list of (custom_id, body) pairs, where body holds the
+    # usual chat.completions.create arguments (model, messages, ...)
+    with open(path, 'w', encoding='utf-8') as file:
+        for custom_id, body in requests:
+            file.write(json.dumps({
+                'custom_id': custom_id,
+                'method': 'POST',
+                'url': CHAT_COMPLETIONS_URL,
+                'body': body,
+            }, ensure_ascii=False) + '\n')
+    return path
+
+
+def parse_batch_results(text):
+    # Return ({custom_id: reply text}, {custom_id: error message}) from a
+    # batch output (or error) file
+    results = {}
+    errors = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        custom_id = entry['custom_id']
+        response = entry.get('response') or {}
+        if entry.get('error') or response.get('status_code') != 200:
+            error = entry.get('error') or {}
+            errors[custom_id] = error.get('message') or f"HTTP {response.get('status_code')}"
+            continue
+        results[custom_id] = response['body']['choices'][0]['message']['content'].strip()
+    return results, errors
+
+
+class OpenAIBatchTransport:
+    # Submits batch files to the OpenAI Batch API
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, batch_path):
+        with open(batch_path, 'rb') as file:
+            input_file = self.client.files.create(file=file, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window='24h',
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        text = ''
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text += self.client.files.content(file_id).text + '\n'
+        return text
+
+
+class LocalBatchTransport:
+    # File-based stand-in for the Batch API. Submitting copies the batch file
+    # into a directory; the first status poll answers every request with the
+    # given client (e.g. llm_stub.StubClient) and writes an output file in
+    # the same format the Batch API produces.
+
+    def __init__(self, directory, client):
+        self.directory = directory
+        self.client = client
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id, kind):
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, batch_path):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        with open(batch_path, 'r', encoding='utf-8') as source:
+            with open(self._path(batch_id, 'input'), 'w', encoding='utf-8') as target:
+                target.write(source.read())
+        return batch_id
+
+    def status(self, batch_id):
+        if not os.path.exists(self._path(batch_id, 'output')):
+            self._process(batch_id)
+        return 'completed'
+
+    def results(self, batch_id):
+        with open(self._path(batch_id, 'output'), 'r', encoding='utf-8') as file:
+            return file.read()
+
+    def _process(self, batch_id):
+        with open(self._path(batch_id, 'input'), 'r', encoding='utf-8') as file:
+            requests = [json.loads(line) for line in file if line.strip()]
+
+        output_lines = []
+        for request in requests:
+            entry = {'id': f"req_{uuid.uuid4().hex[:12]}", 'custom_id': request['custom_id']}
+            try:
+                completion = self.client.chat.completions.create(**request['body'])
+                entry['response'] = {
+                    'status_code': 200,
+                    'body': {'choices': [{'message': {
+                        'role': 'assistant',
+                        'content': completion.choices[0].message.content,
+                    }}]},
+                }
+                entry['error'] = None
+            except Exception as e:
+                entry['response'] = {'status_code': getattr(e, 'status_code', 500), 'body': None}
+                entry['error'] = {'message': str(e)}
+            output_lines.append(json.dumps(entry, ensure_ascii=False))
+
+        # Write to a temp file first so a half-written output is never read
+        output_path = self._path(batch_id, 'output')
+        with open(output_path + '.tmp', 'w', encoding='utf-8') as file:
+            file.write('\n'.join(output_lines) + '\n')
+        os.replace(output_path + '.tmp', output_path)
+
+
+def wait_for_batch(transport, batch_id, poll_interval=60, timeout=24 * 60 * 60):
+    started = time.monotonic()
+    while True:
+        status = transport.status(batch_id)
+        if status in FINISHED_STATUSES:
+            return status
+        if time.monotonic() - started > timeout:
+            raise TimeoutError(f"Batch {batch_id} still '{status}' after {timeout} seconds")
+        print(f"Batch {batch_id} is {status}, checking again in {poll_interval}s")
+        time.sleep(poll_interval)
+
+
+def run_batch(transport, requests, batch_path, poll_interval=60, batch_id=None, journal=None):
+    # Write, submit and wait for a batch, returning (results, errors) keyed
+    # by custom_id. Pass batch_id to pick up a batch submitted earlier. With
+    # a run_journal.RunJournal the submitted batch id is journaled, so a
+    # resumed run polls the same batch instead of paying for a new one.
+    unit = unit_id('batch', batch_path, sorted(custom_id for custom_id, _ in requests))
+    if batch_id is None and journal is not None and journal.is_complete(unit):
+        batch_id = journal.result(unit)
+        print(f"Resuming batch {batch_id} with {len(requests)} requests ({batch_path})")
+    if batch_id is None:
+        write_batch_file(batch_path, requests)
+        batch_id = transport.submit(batch_path)
+        print(f"Submitted batch {batch_id} with {len(requests)} requests ({batch_path})")
+        if journal is not None:
+            journal.record(unit, batch_id, label=f"submit {batch_path}")
+
+    status = wait_for_batch(transport, batch_id, poll_interval)
+    if status != 'completed':
+        print(f"Batch {batch_id} finished with status '{status}'")
+    results, errors = parse_batch_results(transport.results(batch_id))
+    print(f"Batch {batch_id}: {len(results)} succeeded, {len(errors)} failed")
+    return results, errors
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+DEFAULT_CACHE_PATH = '.llm_cache.sqlite'
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def cache_key(model, messages, backend=None, **params):
+    # Hash of everything that determines the reply, independent of dict
+    # ordering. The backend is part of it so a stub reply is never served
+    # to a run against the real API.
+    payload = json.dumps(
+        {'backend': backend, 'model': model, 'messages': messages, 'params': params},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _to_record(completion):
+    # Keep only the parts of a completion the scripts read back
+    usage = getattr(completion, 'usage', None)
+    return {
+        'model': getattr(completion, 'model', None),
+        'choices': [
+            {'message': {'role': choice.message.role, 'content': choice.message.content}}
+            for choice in completion.choices
+        ],
+        'usage': None if usage is None else {
+            'prompt_tokens': usage.prompt_tokens,
+            'completion_tokens': usage.completion_tokens,
+            'total_tokens': usage.total_tokens,
+        },
+    }
+
+
+def _to_namespace(value):
+    # Rebuild attribute access (completion.choices[0].message.content)
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+
+class ResponseCache:
+    # Persistent SQLite cache of completions with a TTL and size-based LRU eviction
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.connection.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self.connection.commit()
+                self.misses += 1
+                return None
+
+            self.connection.execute(
+                'UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key)
+            )
+            self.connection.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key, record):
+        value = json.dumps(record, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, created, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), now, now)
+            )
+            self._evict()
+            self.connection.commit()
+
+    def discard(self, key):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.connection.commit()
+
+    def _evict(self):
+        # Drop expired entries, then least recently used ones until under max_bytes
+        self.connection.execute(
+            'DELETE FROM responses WHERE created < ?', (time.time() - self.ttl_seconds,)
+        )
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.connection.execute(
+            'SELECT key, size FROM responses ORDER BY last_used'
+        ).fetchall():
+            self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+
+class CachedClient:
+    # Wraps an OpenAI-style client so chat.completions.create is served from
+    # the cache when the same model, messages and parameters were seen before.
+    # With bypass=True every call goes to the API, but replies still refresh the cache.
+    # Entries are keyed by the wrapped client's backend (see llm_client.LLMClient).
+
+    def __init__(self, client, cache=None, bypass=False):
+        self.client = client
+        self.cache = cache if cache is not None else ResponseCache()
+        self.bypass = bypass
+        self.backend = getattr(client, 'backend', None)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **params):
+        key = cache_key(model, messages, self.backend, **params)
+        if not self.bypass:
+            record = self.cache.get(key)
+            if record is not None:
+                return _to_namespace(record)
+
+        completion = self.client.chat.completions.create(model=model, messages=messages, **params)
+        record = _to_record(completion)
+        self.cache.put(key, record)
+        return _to_namespace(record)
+
+    def discard(self, model, messages, **params):
+        # Forget a cached reply the caller found unusable
+        self.cache.discard(cache_key(model, messages, self.backend, **params))
+
+    def print_stats(self):
+        stats = self.cache.stats()
+        print(
+            f"LLM cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, "
+            f"{stats['bytes'] / 1024:.1f} KB"
+        )
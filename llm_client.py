@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from llm_cache import cache_key
+
+DEFAULT_BACKEND = 'openai'
+
+# Environment variable (or .env entry) holding the OpenAI API key
+API_KEY_VARIABLE = 'GPT_API_KEY'
+
+
+def _openai_backend(api_key=None, **options):
+    # Imported here so scripts that only import helpers from this module
+    # don't load the OpenAI SDK or read .env
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    # Load environment variables from .env file
+    load_dotenv()
+    # One OpenAI client keeps a pool of keep-alive HTTP connections that
+    # every thread making requests through it shares
+    return OpenAI(api_key=api_key or os.getenv(API_KEY_VARIABLE), **options)
+
+
+def _stub_backend(**options):
+    # Local fake with simulated latency and failures, see llm_stub.StubClient
+    from llm_stub import StubClient
+    return StubClient(**options)
+
+
+# Backend name -> factory taking the client options and returning an
+# OpenAI-style client. register_backend adds more, e.g. a canned fake.
+BACKENDS = {
+    'openai': _openai_backend,
+    'stub': _stub_backend,
+}
+
+
+def register_backend(name, factory):
+    BACKENDS[name] = factory
+
+
+def backend_path(path, backend):
+    # Where a run against this backend keeps a file: the path itself for the
+    # real API, otherwise the backend name goes before the extension
+    # (park_climate.csv -> park_climate.stub.csv) so fake replies never end
+    # up in the real outputs, journal or cache
+    if backend == DEFAULT_BACKEND:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{backend}{extension}"
+
+
+class LLMClient:
+    # OpenAI-style client (client.chat.completions.create) that every script
+    # goes through. The backend client is only created on first use, and
+    # identical requests made while one is already in flight wait for its
+    # reply instead of calling the API again. With a telemetry instance,
+    # every call that actually reaches the backend is recorded.
+
+    def __init__(self, backend=DEFAULT_BACKEND, telemetry=None, **options):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown LLM backend {backend!r}. Known: {', '.join(BACKENDS)}")
+        self.backend = backend
+        self.telemetry = telemetry
+        self.options = options
+        self._client = None
+        self._api = None
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _connect(self):
+        # Create the backend client on first use; returns what calls go through
+        with self.lock:
+            if self._client is None:
+                client = BACKENDS[self.backend](**self.options)
+                if self.telemetry is not None:
+                    from telemetry import InstrumentedClient
+                    self._api = InstrumentedClient(client, self.telemetry, self.backend)
+                else:
+                    self._api = client
+                self._client = client
+            return self._api
+
+    @property
+    def client(self):
+        # The backend's own client, e.g. for the Batch API's files and batches
+        if self._client is None:
+            self._connect()
+        return self._client
+
+    def __getattr__(self, name):
+        # Anything else (files, batches, ...) comes from the backend client
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def create(self, model, messages, **params):
+        key = cache_key(model, messages, **params)
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            api = self._api if self._api is not None else self._connect()
+            completion = api.chat.completions.create(model=model, messages=messages, **params)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(completion)
+            return completion
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def print_stats(self):
+        print(
+            f"LLM client ({self.backend}): {self.calls} calls, "
+            f"{self.coalesced} shared with an identical call in flight"
+        )
@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# HTTP status codes worth retrying: rate limited or a server-side failure
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Exception class names from the openai package that mean the request never
+# got a proper answer and is safe to send again
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError'}
+
+
+class TokenBucket:
+    # Thread-safe token bucket that refills continuously up to its capacity
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        # A single request larger than the whole bucket would wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.refill_per_second
+            time.sleep(wait)
+
+    def adjust(self, amount):
+        # Give back (or, if negative, take) tokens once the real cost of a
+        # request is known. Overspending leaves the bucket below zero, which
+        # makes the next acquire wait it off.
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    # Keeps calls under both a requests-per-minute and a tokens-per-minute budget
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=30000):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def acquire(self, estimated_tokens=0):
+        self.requests.acquire(1)
+        if estimated_tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    def settle(self, estimated_tokens, used_tokens):
+        # Replace a request's estimate with the tokens it actually used
+        self.tokens.adjust(estimated_tokens - used_tokens)
+
+
+def estimate_tokens(messages, max_completion_tokens=1000):
+    # Rough count (about 4 characters per token) so budgeting a request
+    # doesn't need to load a tokenizer
+    prompt_chars = sum(len(message['content']) for message in messages)
+    return prompt_chars // 4 + max_completion_tokens
+
+
+class RateLimitedClient:
+    # Wraps an OpenAI-style client and waits for room in a RateLimiter
+    # before every chat.completions.create call it passes on. The estimate
+    # reserves the full max_completion_tokens, so it is swapped for the
+    # reply's reported usage afterwards. Put it inside CachedClient so
+    # replies served from the cache don't wait.
+    # Attributes it doesn't have itself come from the wrapped client.
+
+    def __init__(self, client, limiter, max_completion_tokens=1000):
+        self.client = client
+        self.limiter = limiter
+        self.max_completion_tokens = max_completion_tokens
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def create(self, model, messages, **params):
+        max_completion_tokens = params.get('max_completion_tokens', self.max_completion_tokens)
+        estimated = estimate_tokens(messages, max_completion_tokens)
+        self.limiter.acquire(estimated)
+        completion = self.client.chat.completions.create(model=model, messages=messages, **params)
+        used = getattr(getattr(completion, 'usage', None), 'total_tokens', None)
+        if used is not None:
+            self.limiter.settle(estimated, used)
+        return completion
+
+
+def is_retryable(error):
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def call_with_backoff(fn, max_retries=5, base_delay=1.0, max_delay=60.0):
+    # Call fn(), retrying rate-limit and server errors with exponential
+    # backoff plus jitter. Any other error is raised straight away.
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            print(f"Retryable error ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_concurrently(fn, items, max_workers=4):
+    # Apply fn to every item using a thread pool, returning results in input order
+    if max_workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fn, items))
@@ -0,0 +1,90 @@
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+class StubAPIError(Exception):
+    # Mimics the status_code attribute of openai.APIStatusError
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def echo_responder(messages):
+    # Reply with whatever follows the last "description(s):" marker in the
+    # prompt, which is the text the real model is asked to rewrite
+    content = messages[-1]['content']
+    parts = re.split(r'descriptions?:', content, flags=re.IGNORECASE)
+    return parts[-1].strip()
+
+
+def climate_table_responder(messages):
+    # Reply with a markdown table of plausible monthly temperatures, seeded
+    # by the prompt so the same park always gets the same numbers
+    rng = random.Random(messages[-1]['content'])
+    base = rng.uniform(0, 50)
+    lines = ['| Month | Avg High (°F) | Avg Low (°F) |', '|-------|---------------|--------------|']
+    months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+              'August', 'September', 'October', 'November', 'December']
+    for number, month in enumerate(months):
+        high = round(base + 35 - abs(6 - number) * 6)
+        lines.append(f'| {month} | {high} | {high - rng.randint(12, 25)} |')
+    return '\n'.join(lines)
+
+
+class StubClient:
+    # Local stand-in for OpenAI() exposing client.chat.completions.create.
+    # Simulates latency and a fraction of 429 / 5xx failures so concurrency,
+    # rate limiting and backoff can be exercised without the real API.
+
+    def __init__(self, latency=0.5, jitter=0.2, rate_limit_rate=0.0, server_error_rate=0.0,
+                 responder=echo_responder, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.responder = responder
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            roll = self.random.random()
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+        try:
+            time.sleep(delay)
+            if roll < self.rate_limit_rate:
+                with self.lock:
+                    self.failures += 1
+                raise StubAPIError('Rate limit reached (stub)', status_code=429)
+            if roll < self.rate_limit_rate + self.server_error_rate:
+                with self.lock:
+                    self.failures += 1
+                raise StubAPIError('Internal server error (stub)', status_code=500)
+
+            content = self.responder(messages)
+            prompt_tokens = sum(len(message['content']) for message in messages) // 4
+            return SimpleNamespace(
+                model=model,
+                choices=[SimpleNamespace(message=SimpleNamespace(role='assistant', content=content))],
+                usage=SimpleNamespace(
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=len(content) // 4,
+                    total_tokens=prompt_tokens + len(content) // 4,
+                ),
+            )
+        finally:
+            with self.lock:
+                self.in_flight -= 1
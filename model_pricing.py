@@ -0,0 +1,14 @@
+# USD per 1M tokens, used for dry-run cost estimates and run telemetry.
+# Kept free of dependencies since every script imports it through telemetry.
+MODEL_PRICING = {
+    'gpt-4o': {'input': 2.50, 'output': 10.00},
+    'chatgpt-4o-latest': {'input': 5.00, 'output': 15.00},
+    'gpt-4o-mini': {'input': 0.15, 'output': 0.60},
+}
+
+
+def estimate_cost(input_tokens, output_tokens, model='gpt-4o'):
+    pricing = MODEL_PRICING.get(model)
+    if pricing is None:
+        return None
+    return (input_tokens * pricing['input'] + output_tokens * pricing['output']) / 1_000_000
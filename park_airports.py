@@ -0,0 +1,120 @@
+import argparse
+import json
+import re
+import sys
+
+import pandas as pd
+
+from distance_matrix import distance_matrix
+from entity_ids import generate_id
+from pipeline_io import load_records, save_records
+
+LOOKUP_PATH = 'park_airports.json'
+PARKS_PATH = 'updated_optimized_national_parks_with_ids.json'
+OUTPUT_PATH = 'national_parks_with_airports.json'
+
+# GPT_Suggested_National_Parks_Airports.csv names some parks differently
+# from national_parks.csv, e.g. "Yellowstone (Montana entrance)" or
+# "National Park of American Samoa"
+_ENTRANCE_SUFFIX = re.compile(r'\s*\(.*\)$')
+_NATIONAL_PARK_PREFIX = re.compile(r'^National Park of\s+', re.IGNORECASE)
+
+
+def suggestion_key(park_name):
+    # Key that matches a suggestion's park name to a park's name
+    return generate_id(_NATIONAL_PARK_PREFIX.sub('', _ENTRANCE_SUFFIX.sub('', park_name)))
+
+
+def _airport_entry(airport, distance, suggested):
+    enplanements = airport.get('enplanements')
+    return {
+        'iata': airport['iata'],
+        'name': airport.get('airport_name'),
+        'city': airport.get('city'),
+        'distance_miles': None if pd.isna(distance) else round(float(distance), 1),
+        'enplanements': None if pd.isna(enplanements) else int(enplanements),
+        'suggested': suggested,
+    }
+
+
+def build_park_airports(parks_df, park_ids, nearest_codes, airports_df, suggested_df, reference=None):
+    # For every park, its nearest airports plus the airports suggested for it,
+    # ranked by distance. nearest_codes holds each park's nearest IATA codes
+    # in the order of parks_df. Suggested airports that filtering dropped
+    # from airports_df take their coordinates from the reference table (a
+    # reference_data.AirportReference); ones that aren't there either are
+    # listed last without a distance.
+    airports = {row['iata']: row for row in airports_df.to_dict('records') if pd.notna(row['iata'])}
+    suggestions = {}
+    for park_name, airport_name, code in suggested_df[['National Park', 'Airport Name', 'Code']].itertuples(index=False):
+        if pd.notna(code):
+            suggestions.setdefault(suggestion_key(park_name), {}).setdefault(code, airport_name)
+            found = reference.lookup(code) if reference is not None and code not in airports else None
+            if found is not None and pd.notna(found['latitude']) and pd.notna(found['longitude']):
+                airports[code] = {
+                    'iata': code, 'airport_name': airport_name,
+                    'latitude': found['latitude'], 'longitude': found['longitude'],
+                }
+
+    lookup = []
+    for park_id, name, lat, lon, nearest in zip(
+        park_ids, parks_df['Name'], parks_df['Latitude'], parks_df['Longitude'], nearest_codes
+    ):
+        suggested = suggestions.get(suggestion_key(name), {})
+        codes = list(dict.fromkeys(list(nearest) + list(suggested)))
+        known = [code for code in codes if code in airports]
+        distances = distance_matrix(
+            [(lat, lon)],
+            [(airports[code]['latitude'], airports[code]['longitude']) for code in known],
+            method='geodesic'
+        )[0] if known else []
+
+        entries = [
+            _airport_entry(airports[code], distance, code in suggested)
+            for code, distance in zip(known, distances)
+        ]
+        entries.sort(key=lambda entry: (entry['distance_miles'] is None, entry['distance_miles'] or 0, entry['iata']))
+        entries.extend(
+            _airport_entry({'iata': code, 'airport_name': suggested[code]}, None, True)
+            for code in codes if code not in airports
+        )
+        for rank, entry in enumerate(entries, start=1):
+            entry['rank'] = rank
+        lookup.append({'id': park_id, 'name': name, 'airports': entries})
+    return lookup
+
+
+def join_park_airports(parks, lookup):
+    # Add each park's ranked airports under 'airports', matched on the id
+    # from add_ids_to_json. Returns the parks and the ids with no entry.
+    by_id = {entry['id']: entry['airports'] for entry in lookup}
+    missing = []
+    joined = []
+    for park in parks:
+        if park['id'] not in by_id:
+            missing.append(park['id'])
+        joined.append({**park, 'airports': by_id.get(park['id'], [])})
+    return joined, missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Add the precomputed nearest airports to each park')
+    parser.add_argument('parks_file', nargs='?', default=PARKS_PATH,
+                        help='Parks JSON with ids from add_ids_to_json')
+    parser.add_argument('--lookup', default=LOOKUP_PATH,
+                        help='Park id -> airports lookup written by filter_airports.py')
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    try:
+        parks = load_records(args.parks_file)
+        lookup = load_records(args.lookup)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    joined, missing = join_park_airports(parks, lookup)
+    if missing:
+        print(f"Warning: no airports for {len(missing)} parks: {', '.join(missing)}")
+    save_records(joined, args.output, ensure_ascii=False)
+    print(f"Saved {len(joined)} parks with airports to {args.output}")
@@ -0,0 +1,333 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llm_client import backend_path
+from telemetry import print_summary, read_events, summarize, telemetry
+
+STATE_PATH = '.pipeline_state.json'
+
+
+def local_modules(script):
+    # The modules of this repo the script imports, directly or through other
+    # modules, including imports made inside functions
+    found = []
+    pending = [script]
+    while pending:
+        with open(pending.pop(), 'r', encoding='utf-8') as file:
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                path = name.split('.')[0] + '.py'
+                if path != script and path not in found and os.path.exists(path):
+                    found.append(path)
+                    pending.append(path)
+    return sorted(found)
+
+
+class Stage:
+    # One step of the pipeline: a script run with some arguments, the files
+    # it reads and the files it writes. The script and the repo modules it
+    # imports count as inputs, so editing any of them makes the stage stale.
+    # LLM stages pay for every rerun, so for them only the script itself
+    # counts; after changing a shared module they run with --force STAGE.
+    # A stage without any data inputs is a source: it only runs when its
+    # outputs are missing.
+
+    def __init__(self, name, script, inputs, outputs, args=(), default=True, llm=False):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.sources = list(inputs)
+        modules = local_modules(script) if os.path.exists(script) and not llm else []
+        self.inputs = [script] + modules + self.sources
+        self.outputs = list(outputs)
+        # Stages with default=False only run when asked for by name
+        self.default = default
+        # LLM stages accept --stub and --concurrency
+        self.llm = llm
+
+    def arguments(self, llm_args=()):
+        return [self.script] + self.args + (list(llm_args) if self.llm else [])
+
+    def on_backend(self, backend):
+        # The same stage run against another LLM backend: the script writes
+        # that backend's own output files (see llm_client.backend_path), and
+        # the stages downstream keep reading the real ones
+        if not self.llm:
+            return self
+        return Stage(self.name, self.script, self.sources, [backend_path(path, backend) for path in self.outputs],
+                     self.args, self.default, self.llm)
+
+
+# The scraper has no data inputs, so it only runs when airports_1.csv is
+# missing or when forced, and then relies on its own conditional requests.
+STAGES = [
+    Stage('scrape', 'scrape_airport_hubs.py', [], ['airports_1.csv']),
+    Stage('filter_airports', 'filter_airports.py',
+          ['airports_1.csv', 'iata-icao.csv', 'GPT_Suggested_National_Parks_Airports.csv', 'national_parks.csv'],
+          ['filtered_airports.csv', 'filtered_iata_icao.csv', 'park_airports.json']),
+    Stage('descriptions', 'update_descriptions.py',
+          ['national_parks.json'],
+          ['updated_national_parks.json', 'updated_optimized_national_parks.json'], llm=True),
+    Stage('add_ids', 'add_ids_to_json.py',
+          ['updated_optimized_national_parks.json'],
+          ['updated_optimized_national_parks_with_ids.json'],
+          args=['updated_optimized_national_parks.json']),
+    Stage('descriptions_csv', 'json_to_csv.py',
+          ['updated_optimized_national_parks.json'],
+          ['updated_optimized_national_parks.csv'],
+          args=['updated_optimized_national_parks.json']),
+    Stage('ids_csv', 'json_to_csv.py',
+          ['updated_optimized_national_parks_with_ids.json'],
+          ['updated_optimized_national_parks_with_ids.csv'],
+          args=['updated_optimized_national_parks_with_ids.json']),
+    Stage('park_airports', 'park_airports.py',
+          ['updated_optimized_national_parks_with_ids.json', 'park_airports.json'],
+          ['national_parks_with_airports.json']),
+    Stage('bundle', 'build_bundle.py',
+          ['updated_optimized_national_parks_with_ids.json', 'park_airports.json'],
+          ['app_bundle/manifest.json']),
+    Stage('climate', 'get_temperature_data.py',
+          ['national_parks.json'], ['park_climate.csv'], default=False, llm=True),
+]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_files(paths):
+    return {path: file_hash(path) if os.path.exists(path) else None for path in paths}
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_state(state, path=STATE_PATH):
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def dependencies(stages):
+    # A stage depends on every stage that writes one of its inputs
+    producers = {output: stage.name for stage in stages for output in stage.outputs}
+    return {
+        stage.name: {producers[path] for path in stage.inputs if path in producers} - {stage.name}
+        for stage in stages
+    }
+
+
+def select_stages(stages, targets):
+    # The requested stages plus everything upstream of them
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [target for target in targets if target not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)}. Known: {', '.join(by_name)}")
+
+    deps = dependencies(stages)
+    selected = set()
+    pending = list(targets) if targets else [stage.name for stage in stages if stage.default]
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+    return [stage for stage in stages if stage.name in selected]
+
+
+def stale_reason(stage, record, arguments):
+    # Why the stage has to run, or None if its recorded run is still current
+    missing_inputs = [path for path in stage.inputs if not os.path.exists(path)]
+    if missing_inputs:
+        return f"missing input {missing_inputs[0]}"
+    if not stage.sources:
+        return "output missing" if any(not os.path.exists(path) for path in stage.outputs) else None
+    if record is None:
+        # No recorded run yet: fall back to make's rule and trust outputs
+        # that are newer than every input
+        if all(os.path.exists(path) for path in stage.outputs) and (
+            min(os.path.getmtime(path) for path in stage.outputs) >=
+            max(os.path.getmtime(path) for path in stage.inputs)
+        ):
+            return None
+        return "never run"
+    if record.get('arguments') != arguments:
+        return "arguments changed"
+    if any(not os.path.exists(path) for path in stage.outputs):
+        return "output missing"
+    if record.get('inputs') != hash_files(stage.inputs):
+        return "inputs changed"
+    if record.get('outputs') != hash_files(stage.outputs):
+        return "outputs modified"
+    return None
+
+
+def record_run(state, stage, arguments, state_path):
+    state[stage.name] = {
+        'arguments': arguments,
+        'inputs': hash_files(stage.inputs),
+        'outputs': hash_files(stage.outputs),
+    }
+    save_state(state, state_path)
+
+
+def run_stage(stage, command, print_lock):
+    # Run the script, prefixing its output with the stage name so parallel
+    # stages can be told apart. The script's own telemetry is tagged with
+    # this run's id through the environment.
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-u'] + command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        encoding='utf-8', errors='replace', env=dict(os.environ, TELEMETRY_RUN_ID=telemetry.run_id)
+    )
+    for line in process.stdout:
+        with print_lock:
+            print(f"[{stage.name}] {line.rstrip()}", flush=True)
+    returncode = process.wait()
+    telemetry.emit('stage', stage=stage.name, seconds=round(time.perf_counter() - start, 4), ok=returncode == 0)
+    return returncode
+
+
+def run_pipeline(stages, state_path=STATE_PATH, jobs=2, force=(), dry_run=False, llm_args=(), tuning_args=()):
+    # Run the stale stages in dependency order, independent ones side by
+    # side. Returns True when every stage is up to date or ran successfully.
+    # llm_args change what the LLM stages produce and are part of the
+    # recorded run; tuning_args only change how fast they run and aren't.
+    state = load_state(state_path)
+    names = {stage.name for stage in stages}
+    deps = {name: upstream & names for name, upstream in dependencies(stages).items() if name in names}
+    print_lock = threading.Lock()
+
+    done, failed = set(), set()
+    pending = list(stages)
+    running = {}
+
+    def ready(stage):
+        return deps[stage.name] <= done
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        while pending or running:
+            for stage in [stage for stage in pending if deps[stage.name] & failed]:
+                pending.remove(stage)
+                failed.add(stage.name)
+                print(f"Skipping {stage.name}: an upstream stage failed")
+
+            for stage in [stage for stage in pending if ready(stage)]:
+                pending.remove(stage)
+                arguments = stage.arguments(llm_args)
+                # Hashing happens here, after upstream stages finished, so an
+                # upstream rerun that produced identical files changes nothing
+                reason = 'forced' if stage.name in force else stale_reason(
+                    stage, state.get(stage.name), arguments
+                )
+                if reason is None:
+                    print(f"Up to date: {stage.name}")
+                    if stage.name not in state and stage.sources and not dry_run:
+                        record_run(state, stage, arguments, state_path)
+                    done.add(stage.name)
+                elif dry_run:
+                    print(f"Would run {stage.name} ({reason}): {' '.join(arguments)}")
+                    done.add(stage.name)
+                else:
+                    print(f"Running {stage.name} ({reason})")
+                    command = arguments + (list(tuning_args) if stage.llm else [])
+                    running[executor.submit(run_stage, stage, command, print_lock)] = (stage, arguments)
+
+            if not running:
+                if pending and not any(ready(stage) for stage in pending):
+                    # Only reachable with a dependency cycle
+                    raise ValueError(f"Cannot order stages: {', '.join(stage.name for stage in pending)}")
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, arguments = running.pop(future)
+                returncode = future.result()
+                if returncode != 0 or any(not os.path.exists(path) for path in stage.outputs):
+                    print(f"Stage {stage.name} failed (exit code {returncode})")
+                    failed.add(stage.name)
+                    continue
+                record_run(state, stage, arguments, state_path)
+                print(f"Finished {stage.name}")
+                done.add(stage.name)
+
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the park and airport data, running only stale stages')
+    parser.add_argument('targets', nargs='*',
+                        help='Stages to build along with what they depend on (default: all default stages)')
+    parser.add_argument('--jobs', '-j', type=int, default=2,
+                        help='Number of independent stages to run at once')
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help='Run this stage even if it is up to date, can be repeated. LLM stages only '
+                             'track their own script, so force them after changing a module they import')
+    parser.add_argument('--force-all', action='store_true',
+                        help='Run every selected stage')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print which stages would run and why')
+    parser.add_argument('--list', action='store_true',
+                        help='List the stages with their inputs and outputs')
+    parser.add_argument('--state-path', default=STATE_PATH,
+                        help='File recording the input and output hashes of each stage run')
+    parser.add_argument('--stub', action='store_true',
+                        help='Pass --stub to the stages that call the API')
+    parser.add_argument('--concurrency', type=int,
+                        help='Pass --concurrency to the stages that call the API')
+    args = parser.parse_args()
+
+    if args.list:
+        deps = dependencies(STAGES)
+        for stage in STAGES:
+            after = f" (after {', '.join(sorted(deps[stage.name]))})" if deps[stage.name] else ''
+            print(f"{stage.name}{'' if stage.default else ' [not default]'}{after}")
+            print(f"  inputs:  {', '.join(stage.inputs)}")
+            print(f"  outputs: {', '.join(stage.outputs)}")
+        return
+
+    try:
+        stages = select_stages(STAGES, args.targets)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    llm_args = ['--stub'] if args.stub else []
+    if args.stub:
+        stages = [stage.on_backend('stub') for stage in stages]
+    tuning_args = [] if args.concurrency is None else ['--concurrency', str(args.concurrency)]
+
+    force = {stage.name for stage in stages} if args.force_all else set(args.force)
+    succeeded = run_pipeline(stages, args.state_path, args.jobs, force, args.dry_run, llm_args, tuning_args)
+    if not args.dry_run:
+        # Everything the stages recorded during this run, not just pipeline.py's own events
+        print_summary(summarize(read_events(telemetry.path, telemetry.run_id)))
+    if not succeeded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Every pipeline artifact is written twice: the CSV/JSON export people look
+# at, and a typed Arrow IPC (Feather v2) file next to it that later stages
+# load instead. Arrow files are memory-mapped on read and keep column types,
+# so nothing has to be re-parsed or re-inferred.
+
+
+def arrow_path(path):
+    return path.rsplit('.', 1)[0] + '.arrow'
+
+
+def _arrow_is_fresh(path):
+    # Use the Arrow copy only if nobody edited the export after it was written
+    columnar = arrow_path(path)
+    if not os.path.exists(columnar):
+        return False
+    return not os.path.exists(path) or os.path.getmtime(columnar) >= os.path.getmtime(path)
+
+
+def _write_arrow(table, path):
+    columnar = arrow_path(path)
+    # Write to a temp file and rename so readers never see a partial file
+    feather.write_feather(table, columnar + '.tmp', compression='uncompressed')
+    os.replace(columnar + '.tmp', columnar)
+
+
+def _write_arrow_or_warn(make_table, path):
+    try:
+        _write_arrow(make_table(), path)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        # Columns with mixed types can't be stored; fall back to the export alone
+        print(f"Warning: could not write {arrow_path(path)} ({e}), loads will use {path}")
+        if os.path.exists(arrow_path(path)):
+            os.remove(arrow_path(path))
+
+
+def save_table(df, path, **csv_kwargs):
+    # Write a DataFrame as CSV plus its Arrow copy
+    csv_kwargs.setdefault('index', False)
+    df.to_csv(path, **csv_kwargs)
+    _write_arrow_or_warn(lambda: pa.Table.from_pandas(df, preserve_index=False), path)
+
+
+def records_table(records):
+    # Arrow table with a column for every key of any record, not just the
+    # first one's (which is all pa.Table.from_pylist looks at). Records that
+    # lack a key would read back with None for it, so ragged records are
+    # rejected and only the JSON export is kept for them.
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    table = pa.table({column: [record.get(column) for record in records] for column in columns})
+    if any(len(record) != len(columns) for record in records) or table.to_pylist() != records:
+        raise pa.ArrowInvalid("records don't round-trip through Arrow (missing keys or mixed types)")
+    return table
+
+
+def save_records(records, path, **json_kwargs):
+    # Write a list of dicts as JSON plus its Arrow copy
+    json_kwargs.setdefault('indent', 2)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(records, file, **json_kwargs)
+    _write_arrow_or_warn(lambda: records_table(records), path)
+
+
+def load_table(path, **csv_kwargs):
+    # Read an artifact as a DataFrame, from its Arrow copy when that is current
+    if _arrow_is_fresh(path):
+        return feather.read_table(arrow_path(path), memory_map=True).to_pandas()
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as file:
+            return pd.DataFrame(json.load(file))
+    return pd.read_csv(path, **csv_kwargs)
+
+
+def load_records(path):
+    # Read an artifact as a list of dicts, from its Arrow copy when that is current
+    if _arrow_is_fresh(path):
+        return feather.read_table(arrow_path(path), memory_map=True).to_pylist()
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return pd.read_csv(path).to_dict('records')
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+CACHE_DIR = '.cache'
+
+# Columns of iata-icao.csv and the types to parse them as
+AIRPORT_DTYPES = {
+    'country_code': 'string',
+    'region_name': 'string',
+    'iata': 'string',
+    'icao': 'string',
+    'airport': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+}
+
+# Bump when the snapshot layout changes so old snapshots get rebuilt
+SNAPSHOT_VERSION = 2
+# Snapshot columns holding the row positions in IATA code order and the
+# codes in that order, so a loaded snapshot can be searched right away
+IATA_ORDER_COLUMN = '_iata_order'
+IATA_SORTED_COLUMN = '_iata_sorted'
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def iata_order(airports):
+    # Row positions sorted by IATA code, rows without a code last. The sort
+    # is stable, so the first of several rows with the same code comes first.
+    codes = airports['iata']
+    valid = np.flatnonzero(codes.notna().to_numpy())
+    order = valid[np.argsort(codes.to_numpy()[valid].astype(str), kind='stable')]
+    return np.concatenate([order, np.flatnonzero(codes.isna().to_numpy())])
+
+
+class AirportReference:
+    # Airport reference table with O(log n) lookups by IATA code, binary
+    # searched in the sorted codes. A snapshot stores the sorted codes and
+    # their row positions, so loading one doesn't rebuild an index.
+
+    def __init__(self, airports, sorted_positions=None, sorted_codes=None):
+        self.airports = airports
+        if sorted_positions is None:
+            # Rows without a code sort last and are left out
+            sorted_positions = iata_order(airports)[:int(airports['iata'].notna().sum())]
+            sorted_codes = airports['iata'].to_numpy()[sorted_positions].astype(str)
+        self.sorted_positions = sorted_positions
+        self.sorted_codes = sorted_codes
+
+    def _position(self, code):
+        if not isinstance(code, str):
+            return None
+        index = np.searchsorted(self.sorted_codes, code)
+        if index < len(self.sorted_codes) and self.sorted_codes[index] == code:
+            return int(self.sorted_positions[index])
+        return None
+
+    def __contains__(self, code):
+        return self._position(code) is not None
+
+    def __len__(self):
+        return len(self.airports)
+
+    def lookup(self, code):
+        # Return the airport's row as a dict, or None for an unknown code
+        position = self._position(code)
+        if position is None:
+            return None
+        return self.airports.iloc[position].to_dict()
+
+
+def _with_iata_index(table, airports):
+    order = iata_order(airports)
+    return table.append_column(IATA_ORDER_COLUMN, pa.array(order)).append_column(
+        IATA_SORTED_COLUMN, table.column('iata').take(pa.array(order))
+    )
+
+
+def _from_snapshot(table):
+    airports = table.drop_columns([IATA_ORDER_COLUMN, IATA_SORTED_COLUMN]).to_pandas()
+    # Codes sort before the rows without one
+    codes = table.column(IATA_SORTED_COLUMN)
+    valid = len(codes) - codes.null_count
+    return AirportReference(
+        airports,
+        table.column(IATA_ORDER_COLUMN).to_numpy()[:valid],
+        codes.slice(0, valid).to_numpy(),
+    )
+
+
+def read_airports_csv(csv_path, columns=None):
+    # Parse with explicit types instead of letting pandas infer them. Only
+    # empty cells are missing, so codes like "NA" (Namibia) stay strings.
+    columns = list(AIRPORT_DTYPES) if columns is None else columns
+    return pd.read_csv(
+        csv_path,
+        usecols=columns,
+        dtype={column: AIRPORT_DTYPES[column] for column in columns},
+        keep_default_na=False,
+        na_values=[''],
+    )[columns]
+
+
+def load_airport_reference(csv_path='iata-icao.csv', columns=None, cache_dir=CACHE_DIR):
+    # Load the airport table from a binary snapshot, rebuilding the snapshot
+    # only when the source CSV has changed. A changed size or mtime triggers
+    # a content hash check, so touching the file doesn't force a reparse.
+    columns = list(AIRPORT_DTYPES) if columns is None else columns
+    name = os.path.basename(csv_path).rsplit('.', 1)[0]
+    snapshot_path = os.path.join(cache_dir, f"{name}.{'-'.join(columns)}.arrow")
+    fingerprint = _fingerprint(csv_path)
+
+    if os.path.exists(snapshot_path):
+        table = feather.read_table(snapshot_path, memory_map=True)
+        source = json.loads((table.schema.metadata or {}).get(b'source', b'{}'))
+        if source.get('version') == SNAPSHOT_VERSION:
+            if source.get('size') == fingerprint['size'] and source.get('mtime_ns') == fingerprint['mtime_ns']:
+                return _from_snapshot(table)
+            if source.get('sha256') == _file_hash(csv_path):
+                _write_snapshot(table, snapshot_path, dict(source, **fingerprint))
+                return _from_snapshot(table)
+
+    airports = read_airports_csv(csv_path, columns)
+    source = dict(fingerprint, sha256=_file_hash(csv_path), version=SNAPSHOT_VERSION)
+    os.makedirs(cache_dir, exist_ok=True)
+    table = _with_iata_index(pa.Table.from_pandas(airports, preserve_index=False), airports)
+    _write_snapshot(table, snapshot_path, source)
+    return _from_snapshot(table)
+
+
+def _write_snapshot(table, snapshot_path, source):
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'source'] = json.dumps(source).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    feather.write_feather(table, snapshot_path + '.tmp', compression='uncompressed')
+    os.replace(snapshot_path + '.tmp', snapshot_path)
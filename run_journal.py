@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def unit_id(kind, *parts):
+    # Name a unit of work by its kind plus a short hash of its inputs, so a
+    # resumed run never reuses a result computed from different input
+    digest = hashlib.sha256(
+        json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    ).hexdigest()[:12]
+    return f"{kind}:{digest}"
+
+
+class RunJournal:
+    # Append-only JSON lines log of completed units of work. Each line is
+    # written and flushed as soon as its unit finishes, so a killed run
+    # loses at most the units that were still in flight.
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.results = {}
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            with open(path, 'rb+') as file:
+                data = file.read()
+                # A crash mid-write can leave a truncated last line. Cut it
+                # off so the next record starts on a line of its own
+                # instead of being appended to the broken one.
+                complete = data.rfind(b'\n') + 1
+                if complete < len(data):
+                    file.truncate(complete)
+            for line in data[:complete].decode('utf-8').splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.results[entry['unit']] = entry['result']
+        else:
+            # Start a fresh journal
+            open(path, 'w', encoding='utf-8').close()
+
+    def is_complete(self, unit):
+        return unit in self.results
+
+    def result(self, unit):
+        return self.results[unit]
+
+    def record(self, unit, result, label=None):
+        entry = {'unit': unit, 'label': label, 'result': result, 'time': time.time()}
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self.results[unit] = result
+
+    def status(self, units):
+        # Split (unit, label) pairs into completed and pending labels
+        completed = [label for unit, label in units if self.is_complete(unit)]
+        pending = [label for unit, label in units if not self.is_complete(unit)]
+        return completed, pending
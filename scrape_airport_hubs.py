@@ -1,54 +1,319 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import unquote, urlparse
+
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-
-def scrape_wikipedia_tables():
-    # URLs of the Wikipedia pages
-    urls = [
-        'https://en.wikipedia.org/wiki/List_of_airports_in_the_United_States',
-        'https://en.wikipedia.org/wiki/List_of_airports_in_American_Samoa'
-    ]
-    
-    all_tables = []
-    first_table_columns = None
-    
-    for url in urls:
-        try:
-            # Send GET request to the URL
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            # Parse the HTML content
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find all tables in the page
-            tables = pd.read_html(response.text)
-            
-            # Process each table
-            for i, table in enumerate(tables):
-                # Check if any of the column names exactly match Airport, FAA, or IATA
-                if any(col for col in table.columns if col in ['Airport', 'FAA', 'IATA']):
-                    if first_table_columns is None:
-                        # Store column names from first valid table (US airports)
-                        first_table_columns = table.columns
-                        all_tables.append(table)
-                    else:
-                        # Rename columns to match first table
-                        table.columns = first_table_columns[:len(table.columns)]
-                        all_tables.append(table)
-    
-        except requests.RequestException as e:
-            print(f"Error fetching the webpage {url}: {e}")
-        except Exception as e:
-            print(f"An error occurred with {url}: {e}")
-    
-    if all_tables:
-        # Concatenate all tables
-        combined_table = pd.concat(all_tables, ignore_index=True)
-        
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pipeline_io import save_table
+from reference_data import CACHE_DIR
+from telemetry import telemetry
+
+# URLs of the Wikipedia pages
+DEFAULT_URLS = [
+    'https://en.wikipedia.org/wiki/List_of_airports_in_the_United_States',
+    'https://en.wikipedia.org/wiki/List_of_airports_in_American_Samoa'
+]
+
+HTML_CACHE_DIR = os.path.join(CACHE_DIR, 'html')
+
+# Synthetic stand-ins for the default pages (made-up rows laid out like the
+# Wikipedia tables, not captures of them) and the airports_1.csv they should
+# combine into, used by --check
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'airport_hubs')
+EXPECTED_FIXTURE_OUTPUT = os.path.join(FIXTURES_DIR, 'expected_airports.csv')
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 30)
+
+USER_AGENT = 'parks-app-scripts/1.0 (airport hub scraper)'
+
+# Header names as they appear on the different pages -> the column name
+# used in airports_1.csv. Headers are compared lowercased with footnote
+# markers like "[3]" removed.
+COLUMN_ALIASES = {
+    'city': 'City',
+    'city served': 'City',
+    'faa': 'FAA',
+    'iata': 'IATA',
+    'icao': 'ICAO',
+    'airport': 'Airport',
+    'airport name': 'Airport',
+    'role': 'Role',
+    'enplanements': 'Enplanements',
+}
+
+# A table is an airport table if it has one of these columns
+KEY_COLUMNS = ['Airport', 'FAA', 'IATA']
+
+_FOOTNOTE = re.compile(r'\[[^\]]*\]')
+
+
+def create_session(pool_size=4, retries=3):
+    # One pooled session for every page, retrying rate limits and server errors
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET'],
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def fixture_name(url):
+    # File name a page is saved under in a fixtures directory
+    name = unquote(urlparse(url).path.rstrip('/').rsplit('/', 1)[-1])
+    return name if name.endswith('.html') else name + '.html'
+
+
+def _cache_paths(url, cache_dir):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, key + '.html'), os.path.join(cache_dir, key + '.json')
+
+
+def fetch_page(session, url, cache_dir=HTML_CACHE_DIR):
+    # Fetch a page, sending the cached ETag/Last-Modified so an unchanged
+    # page comes back as an empty 304 and is read from disk instead
+    html_path, meta_path = _cache_paths(url, cache_dir)
+    headers = {}
+    if os.path.exists(html_path) and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    response = session.get(url, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304:
+        with open(html_path, 'r', encoding='utf-8') as file:
+            return file.read(), True
+    response.raise_for_status()
+    if 'charset' not in response.headers.get('Content-Type', ''):
+        # requests would fall back to Latin-1 here; the pages are UTF-8
+        response.encoding = 'utf-8'
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(html_path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(response.text)
+    os.replace(html_path + '.tmp', html_path)
+    with open(meta_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }, file)
+    return response.text, False
+
+
+def read_fixture(fixtures_dir, url):
+    with open(os.path.join(fixtures_dir, fixture_name(url)), 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def normalize_column(column):
+    # Multi-row headers come back as tuples; the last row is the column name
+    if isinstance(column, tuple):
+        column = column[-1]
+    name = _FOOTNOTE.sub('', str(column)).strip()
+    return COLUMN_ALIASES.get(name.lower(), name)
+
+
+def airport_tables(html):
+    # Parse the page once and keep the tables that list airports, with
+    # their headers renamed to the common column names
+    tables = []
+    for table in pd.read_html(StringIO(html)):
+        table.columns = [normalize_column(column) for column in table.columns]
+        # Check if any of the column names exactly match Airport, FAA, or IATA
+        if any(col in KEY_COLUMNS for col in table.columns):
+            tables.append(table.loc[:, ~table.columns.duplicated()])
+    return tables
+
+
+def scrape_page(session, url, fixtures_dir=None, save_fixtures_dir=None):
+    try:
+        if fixtures_dir is not None:
+            html, source = read_fixture(fixtures_dir, url), 'fixture'
+        else:
+            html, cached = fetch_page(session, url)
+            source = 'cached, unchanged' if cached else 'downloaded'
+        if save_fixtures_dir is not None:
+            with open(os.path.join(save_fixtures_dir, fixture_name(url)), 'w', encoding='utf-8') as file:
+                file.write(html)
+        tables = airport_tables(html)
+        print(f"{url}: {len(tables)} airport tables ({source})")
+        return tables
+
+    except requests.RequestException as e:
+        print(f"Error fetching the webpage {url}: {e}")
+    except Exception as e:
+        print(f"An error occurred with {url}: {e}")
+    return []
+
+
+def combine_pages(urls=DEFAULT_URLS, max_workers=4, fixtures_dir=None, save_fixtures_dir=None):
+    if save_fixtures_dir is not None:
+        os.makedirs(save_fixtures_dir, exist_ok=True)
+
+    session = create_session(pool_size=max_workers)
+    with telemetry.stage('fetch and parse'), ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pages = list(executor.map(
+            lambda url: scrape_page(session, url, fixtures_dir, save_fixtures_dir), urls
+        ))
+
+    # Keep page order so the first page (US airports) sets the column order
+    all_tables = [table for tables in pages for table in tables]
+    if not all_tables:
+        return None
+
+    # Concatenate all tables; columns are matched by name, not position
+    return pd.concat(all_tables, ignore_index=True)
+
+
+def scrape_wikipedia_tables(urls=DEFAULT_URLS, output_path='airports_1.csv', max_workers=4,
+                            fixtures_dir=None, save_fixtures_dir=None):
+    combined_table = combine_pages(urls, max_workers, fixtures_dir, save_fixtures_dir)
+
+    if combined_table is not None:
         # Save to CSV
-        combined_table.to_csv('airports_1.csv', index=False)
-        print(f"Saved combined table to airports_1.csv")
+        save_table(combined_table, output_path)
+        print(f"Saved combined table to {output_path}")
+
+
+def check_columns(fixtures_dir, expected_path):
+    # Scrape the saved pages offline and compare with the expected CSV. The
+    # pages list their columns in different orders and under different
+    # header names, so any row that comes out shifted shows up here.
+    combined_table = combine_pages(DEFAULT_URLS, fixtures_dir=fixtures_dir)
+    actual = '' if combined_table is None else combined_table.to_csv(index=False)
+    with open(expected_path, 'r', encoding='utf-8') as file:
+        expected = file.read()
+
+    if actual == expected:
+        print(f"Columns line up: output matches {expected_path}")
+        return True
+
+    print(f"Error: scraped fixtures don't match {expected_path}")
+    actual_lines, expected_lines = actual.splitlines(), expected.splitlines()
+    for number in range(max(len(actual_lines), len(expected_lines))):
+        got = actual_lines[number] if number < len(actual_lines) else '<missing>'
+        wanted = expected_lines[number] if number < len(expected_lines) else '<missing>'
+        if got != wanted:
+            print(f"  line {number + 1}: expected {wanted}")
+            print(f"  {' ' * len(str(number + 1))}       got      {got}")
+    return False
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    # Serves the fixture pages with an ETag and Last-Modified, answering a
+    # matching If-None-Match (or, without one, If-Modified-Since) with 304
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        self.etag = None
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                self.etag = '"' + hashlib.sha256(file.read()).hexdigest()[:16] + '"'
+            if self.headers.get('If-None-Match') == self.etag:
+                self.send_response(304)
+                self.end_headers()
+                return None
+        return super().send_head()
+
+    def end_headers(self):
+        if getattr(self, 'etag', None):
+            self.send_header('ETag', self.etag)
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check_conditional_requests(fixtures_dir):
+    # Fetch every fixture page twice from a local server into an empty
+    # cache: the first fetch must download it, the second must get a 304
+    # and read the same text back from the cache
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(FixtureHandler, directory=fixtures_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    session = create_session()
+    ok = True
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for url in DEFAULT_URLS:
+                local_url = f"http://127.0.0.1:{server.server_port}/{fixture_name(url)}"
+                first, first_cached = fetch_page(session, local_url, cache_dir)
+                second, second_cached = fetch_page(session, local_url, cache_dir)
+                if first_cached or not second_cached or first != second or first != read_fixture(fixtures_dir, url):
+                    print(f"Error: conditional requests for {fixture_name(url)} "
+                          f"(first cached: {first_cached}, second cached: {second_cached})")
+                    ok = False
+    finally:
+        server.shutdown()
+        server.server_close()
+    if ok:
+        print("Conditional requests: unchanged pages come back as 304 and are read from the cache")
+    return ok
+
+
+def check_fixtures(fixtures_dir=FIXTURES_DIR, expected_path=EXPECTED_FIXTURE_OUTPUT):
+    # Exit non-zero if either offline check fails
+    columns_ok = check_columns(fixtures_dir, expected_path)
+    requests_ok = check_conditional_requests(fixtures_dir)
+    if not (columns_ok and requests_ok):
+        sys.exit(1)
+
+
+def read_url_file(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
 
 if __name__ == "__main__":
-    scrape_wikipedia_tables()
+    parser = argparse.ArgumentParser(description='Scrape airport tables from Wikipedia into airports_1.csv')
+    parser.add_argument('--url', action='append', dest='urls',
+                        help='Page to scrape, can be repeated (default: US and American Samoa lists)')
+    parser.add_argument('--url-file',
+                        help='File with one page URL per line, e.g. one per state or territory')
+    parser.add_argument('--output', default='airports_1.csv')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of pages to fetch at once')
+    parser.add_argument('--fixtures',
+                        help='Read pages from saved HTML files in this directory instead of the network')
+    parser.add_argument('--save-fixtures',
+                        help='Also save each page to this directory for later --fixtures runs')
+    parser.add_argument('--check', action='store_true',
+                        help='Check the columns of the committed fixture pages line up and that '
+                             'conditional requests for them are answered from the cache')
+    args = parser.parse_args()
+
+    if args.check:
+        check_fixtures(args.fixtures or FIXTURES_DIR)
+        sys.exit(0)
+
+    urls = list(args.urls or [])
+    if args.url_file:
+        urls.extend(read_url_file(args.url_file))
+
+    scrape_wikipedia_tables(
+        urls or DEFAULT_URLS, args.output, args.workers,
+        fixtures_dir=args.fixtures, save_fixtures_dir=args.save_fixtures
+    )
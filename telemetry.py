@@ -0,0 +1,209 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from model_pricing import estimate_cost
+
+# Every script appends its events here as JSON lines. pipeline.py sets
+# TELEMETRY_RUN_ID for the scripts it starts so one run can be summarized
+# across all of them.
+DEFAULT_TELEMETRY_PATH = 'telemetry.jsonl'
+# Only calls to this backend cost money; calls to others (like the local
+# stub) are recorded without a cost
+PRICED_BACKEND = 'openai'
+
+
+class Telemetry:
+    # Records timing, LLM usage, cache and row count events for one script
+    # run, appending each one to a JSON lines file as it happens
+
+    def __init__(self, path=None, run_id=None, script=None):
+        self.path = path if path is not None else os.environ.get('TELEMETRY_PATH', DEFAULT_TELEMETRY_PATH)
+        self.run_id = run_id or os.environ.get('TELEMETRY_RUN_ID') or uuid.uuid4().hex[:12]
+        self.script = script or os.path.basename(sys.argv[0] or 'python')
+        self.events = []
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {'time': time.time(), 'run': self.run_id, 'script': self.script, 'event': event, **fields}
+        with self.lock:
+            self.events.append(record)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    @contextmanager
+    def stage(self, name):
+        # Time a block of work; the event is written even if the block fails
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.emit('stage', stage=name, seconds=round(time.perf_counter() - start, 4), ok=ok)
+
+    def rows(self, step, rows_in, rows_out):
+        print(f"{step}: {rows_in} -> {rows_out} rows")
+        self.emit('rows', step=step, rows_in=int(rows_in), rows_out=int(rows_out))
+
+    def llm_call(self, model, seconds, prompt_tokens=None, completion_tokens=None, error=None,
+                 backend=PRICED_BACKEND):
+        cost = None
+        if backend == PRICED_BACKEND and prompt_tokens is not None and completion_tokens is not None:
+            cost = estimate_cost(prompt_tokens, completion_tokens, model)
+        self.emit(
+            'llm_call', model=model, backend=backend, seconds=round(seconds, 4), prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens, cost=cost, error=error
+        )
+
+    def cache_stats(self, stats):
+        self.emit('cache', hits=stats['hits'], misses=stats['misses'])
+
+    def summary(self):
+        with self.lock:
+            return summarize(self.events)
+
+    def print_summary(self):
+        print_summary(self.summary())
+
+
+class InstrumentedClient:
+    # Wraps an OpenAI-style client and records latency, token usage and
+    # estimated cost of every chat.completions.create call. Put it inside
+    # CachedClient so only calls that actually reach the API are counted.
+    # Calls to a backend other than PRICED_BACKEND are recorded without a cost.
+
+    def __init__(self, client, telemetry, backend=PRICED_BACKEND):
+        self.client = client
+        self.telemetry = telemetry
+        self.backend = backend
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **params):
+        start = time.perf_counter()
+        try:
+            completion = self.client.chat.completions.create(model=model, messages=messages, **params)
+        except Exception as e:
+            self.telemetry.llm_call(
+                model, time.perf_counter() - start, error=type(e).__name__, backend=self.backend
+            )
+            raise
+        usage = getattr(completion, 'usage', None)
+        self.telemetry.llm_call(
+            model, time.perf_counter() - start,
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None),
+            backend=self.backend,
+        )
+        return completion
+
+
+def read_events(path=DEFAULT_TELEMETRY_PATH, run_id=None):
+    if not os.path.exists(path):
+        return []
+    events = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if run_id is None or event.get('run') == run_id:
+                events.append(event)
+    return events
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(events):
+    # Totals per stage, LLM model, cache and filtering step
+    stages = {}
+    models = {}
+    latencies = []
+    cache = {'hits': 0, 'misses': 0}
+    rows = []
+    for event in events:
+        kind = event['event']
+        if kind == 'stage':
+            key = f"{event['script']}:{event['stage']}"
+            stage = stages.setdefault(key, {'seconds': 0.0, 'runs': 0, 'failed': 0})
+            stage['seconds'] += event['seconds']
+            stage['runs'] += 1
+            stage['failed'] += not event['ok']
+        elif kind == 'llm_call':
+            # Unpriced backends are listed apart, e.g. "gpt-4o (stub)"
+            backend = event.get('backend', PRICED_BACKEND)
+            name = event['model'] if backend == PRICED_BACKEND else f"{event['model']} ({backend})"
+            model = models.setdefault(name, {
+                'calls': 0, 'errors': 0, 'seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0
+            })
+            model['calls'] += 1
+            model['seconds'] += event['seconds']
+            latencies.append(event['seconds'])
+            if event.get('error'):
+                model['errors'] += 1
+                continue
+            model['prompt_tokens'] += event.get('prompt_tokens') or 0
+            model['completion_tokens'] += event.get('completion_tokens') or 0
+            model['cost'] += event.get('cost') or 0.0
+        elif kind == 'cache':
+            cache['hits'] += event['hits']
+            cache['misses'] += event['misses']
+        elif kind == 'rows':
+            rows.append({key: event[key] for key in ('script', 'step', 'rows_in', 'rows_out')})
+
+    lookups = cache['hits'] + cache['misses']
+    cache['hit_rate'] = cache['hits'] / lookups if lookups else None
+    return {
+        'stages': stages,
+        'llm': {
+            'models': models,
+            'calls': sum(model['calls'] for model in models.values()),
+            'cost': sum(model['cost'] for model in models.values()),
+            'latency_p50': _percentile(latencies, 0.5) if latencies else None,
+            'latency_p95': _percentile(latencies, 0.95) if latencies else None,
+        },
+        'cache': cache,
+        'rows': rows,
+    }
+
+
+def print_summary(summary):
+    print("\nRun summary")
+    for name, stage in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+        runs = f"  ({stage['runs']} runs)" if stage['runs'] > 1 else ''
+        failed = f"  FAILED x{stage['failed']}" if stage['failed'] else ''
+        print(f"  {name:<40} {stage['seconds']:>9.2f}s{runs}{failed}")
+
+    llm = summary['llm']
+    if llm['calls']:
+        print(
+            f"  LLM: {llm['calls']} calls, ~${llm['cost']:.4f}, "
+            f"latency p50 {llm['latency_p50']:.2f}s / p95 {llm['latency_p95']:.2f}s"
+        )
+        for name, model in sorted(summary['llm']['models'].items()):
+            print(
+                f"    {name}: {model['calls']} calls ({model['errors']} failed), "
+                f"{model['prompt_tokens']} in / {model['completion_tokens']} out tokens, "
+                f"~${model['cost']:.4f}, {model['seconds']:.1f}s waiting"
+            )
+
+    cache = summary['cache']
+    if cache['hit_rate'] is not None:
+        print(f"  LLM cache: {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.0%} hit rate)")
+
+    for step in summary['rows']:
+        print(f"  {step['script']}: {step['step']}: {step['rows_in']} -> {step['rows_out']} rows")
+
+
+# Shared instance for the running script
+telemetry = Telemetry()
@@ -1,16 +1,14 @@
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
+import argparse
 
-# Load environment variables from .env file
-load_dotenv()
+from llm_client import LLMClient
 
-# Set up OpenAI API key from environment variable
-api_key = os.getenv('GPT_API_KEY')
+parser = argparse.ArgumentParser(description='Send one test prompt through the shared LLM client')
+parser.add_argument('--stub', action='store_true',
+                    help='Use the local stub backend instead of the OpenAI API')
+args = parser.parse_args()
 
-client = OpenAI(
-  api_key=api_key
-)
+# Reads the API key from GPT_API_KEY in the environment or .env file
+client = LLMClient('stub' if args.stub else 'openai')
 
 completion = client.chat.completions.create(
   model="gpt-4o-mini",
@@ -20,4 +18,4 @@ completion = client.chat.completions.create(
   ]
 )
 
-print(completion.choices[0].message);
\ No newline at end of file
+print(completion.choices[0].message)
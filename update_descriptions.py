@@ -1,131 +1,619 @@
 import json
-import time
-from openai import OpenAI
-from dotenv import load_dotenv
+import hashlib
+import re
 import os
+import sys
 import argparse
-import tiktoken
+
+from chunk_planner import (
+    DEFAULT_MAX_INPUT_TOKENS, DEFAULT_MAX_OUTPUT_TOKENS, count_tokens, estimate_cost, plan_chunks,
+    print_plan
+)
+from description_similarity import analyze_descriptions, print_analysis
+from llm_batch import LocalBatchTransport, OpenAIBatchTransport, run_batch
+from llm_cache import DEFAULT_CACHE_PATH, CachedClient, ResponseCache
+from llm_client import DEFAULT_BACKEND, LLMClient, backend_path
+from llm_concurrency import RateLimitedClient, RateLimiter, call_with_backoff, run_concurrently
+from pipeline_io import load_records, save_records
+from run_journal import RunJournal, unit_id
+from telemetry import telemetry
+
+SOURCE_PATH = 'national_parks.json'
+REWRITE_PATH = 'updated_national_parks.json'
+OPTIMIZED_PATH = 'updated_optimized_national_parks.json'
+JOURNAL_PATH = 'update_descriptions_journal.jsonl'
+REWRITE_BATCH_PATH = 'rewrite_batch.jsonl'
+OPTIMIZE_BATCH_PATH = 'optimize_batch.jsonl'
+# Content hashes of the inputs behind the current output files, used to
+# only regenerate parks whose source changed
+MANIFEST_PATH = 'updated_national_parks.hashes.json'
+REWRITE_MODEL = "chatgpt-4o-latest"
+OPTIMIZE_MODEL = "gpt-4o"
+# Most repeated phrases named in one optimization prompt
+MAX_PROMPT_PHRASES = 15
+
+# Each description in an optimization prompt is introduced by a numbered
+# marker so the reply can be checked and mapped back onto its park
+DESCRIPTION_MARKER = "[[{number}]]"
+MARKER_PATTERN = re.compile(r"^[ \t]*\[\[(\d+)\]\][ \t]*$", re.MULTILINE)
+
+class ChunkValidationError(Exception):
+    pass
+
+def build_rewrite_messages(park_name, original_description):
+    return [
+        {
+            "role": "user", 
+            "content": f"""
+                Please rewrite this national park description for {park_name} 
+                in an engaging and informative way while maintaining the key information. 
+                You can add any information that would be useful or interesting to an outdoors 
+                enthusiast. Focus on detail rather than dramatic or exaggerated diction. 
+                Do not include a title, just the description. Make sure to output in 
+                a plain text format that can be directly pasted inside of an html div.
+                Do not include any html tags or formatting in the output.
+                Here is the original description: 
+                {original_description}
+            """
+        }
+    ]
 
 def get_new_description(client, park_name, original_description):
     try:
-        completion = client.chat.completions.create(
-            model="chatgpt-4o-latest",
-            store=True,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": f"""
-                        Please rewrite this national park description for {park_name} 
-                        in an engaging and informative way while maintaining the key information. 
-                        You can add any information that would be useful or interesting to an outdoors 
-                        enthusiast. Focus on detail rather than dramatic or exaggerated diction. 
-                        Do not include a title, just the description. Make sure to output in 
-                        a plain text format that can be directly pasted inside of an html div.
-                        Do not include any html tags or formatting in the output.
-                        Here is the original description: 
-                        {original_description}
-                    """
-                }
-            ]
-        )
+        messages = build_rewrite_messages(park_name, original_description)
+
+        def request():
+            return client.chat.completions.create(
+                model=REWRITE_MODEL,
+                store=True,
+                messages=messages
+            )
+
+        completion = call_with_backoff(request)
         return completion.choices[0].message.content.strip()
     except Exception as e:
         print(f"Error getting new description: {e}")
         return None
 
-def split_into_parts(descriptions, num_parts):
-    # Calculate the size of each part
-    part_size = len(descriptions) // num_parts
-    # Create the parts
-    parts = []
-    for i in range(num_parts):
-        start = i * part_size
-        # For the last part, include any remaining items
-        end = start + part_size if i < num_parts - 1 else len(descriptions)
-        parts.append(descriptions[start:end])
-    return parts
-
-def optimize_descriptions(client, descriptions, num_parts=10):
+def describe_unit(park):
+    return unit_id('describe', park['Name'], park['Description'])
+
+def rewrite_descriptions(client, parks_data, concurrency=1, journal=None):
+    # Rewrite every park description, running up to `concurrency` requests at once
+    def rewrite(park):
+        unit = describe_unit(park)
+        if journal is not None and journal.is_complete(unit):
+            print(f"\nSkipping {park['Name']} (already rewritten)")
+            return journal.result(unit)
+
+        new_description = get_new_description(client, park['Name'], park['Description'])
+
+        if new_description:
+            if journal is not None:
+                journal.record(unit, new_description, label=f"describe {park['Name']}")
+            # Print original and new descriptions in one call so concurrent
+            # workers don't interleave their output
+            print(
+                f"\nProcessed: {park['Name']}"
+                f"\n\nOriginal Description:\n{park['Description']}"
+                f"\n\nNew Description:\n{new_description}"
+            )
+            return new_description
+        return park['Description']
+
+    return run_concurrently(rewrite, parks_data, max_workers=concurrency)
+
+def mark_descriptions(part):
+    # Put a numbered marker on its own line in front of every description
+    return "\n\n".join(
+        f"{DESCRIPTION_MARKER.format(number=number)}\n{description}"
+        for number, description in enumerate(part, start=1)
+    )
+
+def build_optimize_prompt(part, phrases=()):
+    marked_descriptions = mark_descriptions(part)
+    # Point the model at the phrases the local analysis found repeated
+    repeated = ""
+    if phrases:
+        repeated = "\n        These phrases are repeated across many park descriptions, so vary or rephrase them:"
+        repeated += "".join(f'\n        - "{phrase}"' for phrase in phrases)
+    return f"""
+        I have multiple national park descriptions, each starting with a marker like [[1]] on its own line.
+        Please review all descriptions and make very minor changes in wording to reduce repetitive language 
+        across sections while maintaining the unique character and key information of each park.
+        Keep every marker exactly as given, on its own line, in the same order, in front of its description.
+        Do not include any other text in the output, just the markers and descriptions.
+        Do not remove any useful information from the descriptions. Make sure to keep the same number of descriptions.{repeated}
+        Here are the descriptions:
+
+        {marked_descriptions}
+    """
+
+def parse_marked_descriptions(text, expected_count):
+    # Split a reply on its markers and check it holds exactly markers 1..n in order
+    pieces = MARKER_PATTERN.split(text.strip())
+    numbers = [int(number) for number in pieces[1::2]]
+    if pieces[0].strip() or numbers != list(range(1, expected_count + 1)):
+        raise ChunkValidationError(
+            f"expected markers 1-{expected_count}, got {numbers or 'none'}"
+        )
+    descriptions = [desc.strip() for desc in pieces[2::2]]
+    if not all(descriptions):
+        raise ChunkValidationError("reply contains an empty description")
+    return descriptions
+
+def plan_optimize_chunks(descriptions, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                         max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, groups=None, phrases=()):
+    # Encode every description once and pack them into token-budgeted chunks
+    overhead_tokens, marker_tokens = count_tokens(
+        [build_optimize_prompt([], phrases), DESCRIPTION_MARKER.format(number=99) + "\n\n"], OPTIMIZE_MODEL
+    )
+    return plan_chunks(
+        count_tokens(descriptions, OPTIMIZE_MODEL),
+        max_input_tokens=max_input_tokens,
+        max_output_tokens=max_output_tokens,
+        overhead_tokens=overhead_tokens,
+        separator_tokens=marker_tokens,
+        groups=groups,
+    )
+
+def plan_optimize(descriptions, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                  max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, repetitive_only=True):
+    # Chunks for the optimizer, each with the positions of its descriptions
+    # ('indices') and the repeated phrases to name in its prompt. With
+    # repetitive_only, only the descriptions the local similarity analysis
+    # flags are sent, grouped by cluster; the rest are kept as they are.
+    if not repetitive_only:
+        chunks = plan_optimize_chunks(descriptions, max_input_tokens, max_output_tokens)
+        for chunk in chunks:
+            chunk['indices'] = list(range(chunk['start'], chunk['end']))
+            chunk['phrases'] = []
+        return chunks
+
+    analysis = analyze_descriptions(descriptions)
+    order = [index for cluster in analysis['clusters'] for index in cluster['members']]
+    if not order:
+        return []
+    groups = [number for number, cluster in enumerate(analysis['clusters']) for _ in cluster['members']]
+    # Leave room in every prompt for a full list of phrases
+    longest_phrases = [phrase for phrase, _ in analysis['phrases'][:MAX_PROMPT_PHRASES]]
+    chunks = plan_optimize_chunks(
+        [descriptions[index] for index in order], max_input_tokens, max_output_tokens, groups, longest_phrases
+    )
+    for chunk in chunks:
+        chunk['indices'] = order[chunk['start']:chunk['end']]
+        found = {phrase for index in chunk['indices'] for phrase in analysis['description_phrases'][index]}
+        chunk['phrases'] = [phrase for phrase, _ in analysis['phrases'] if phrase in found][:MAX_PROMPT_PHRASES]
+    return chunks
+
+def chunk_descriptions(descriptions, chunk):
+    return [descriptions[index] for index in chunk['indices']]
+
+def build_optimize_messages(part, phrases=()):
+    return [
+        {
+            "role": "user", 
+            "content": build_optimize_prompt(part, phrases)
+        }
+    ]
+
+def optimize_part(client, part, label, input_tokens, phrases=()):
+    messages = build_optimize_messages(part, phrases)
+    params = {"max_completion_tokens": DEFAULT_MAX_OUTPUT_TOKENS}
+    print(f"Input token count for {label}: {input_tokens}")
+
+    def request():
+        return client.chat.completions.create(model=OPTIMIZE_MODEL, messages=messages, **params)
+
+    completion = call_with_backoff(request)
+
+    # Count tokens
+    output_text = completion.choices[0].message.content.strip()
+    token_count = count_tokens([output_text], OPTIMIZE_MODEL)[0]
+    print(f"Output token count for {label}: {token_count}")
+
     try:
-        # Split descriptions into parts
-        description_parts = split_into_parts(descriptions, num_parts)
-        all_output_descriptions = []
-
-        for idx, part in enumerate(description_parts):
-            joined_descriptions = "UNIQUE_SEPARATOR".join(part)
-            prompt = f"""
-                I have multiple national park descriptions separated by 'UNIQUE_SEPARATOR'.
-                Please review all descriptions and make very minor changes in wording to reduce repetitive language 
-                across sections while maintaining the unique character and key information of each park.
-                Keep the 'UNIQUE_SEPARATOR' separators in exactly the same places.
-                Do not include any other text in the output, just the descriptions and separators.
-                Do not remove any useful information from the descriptions. Make sure to keep the same number of descriptions.
-                Here are the descriptions:
-
-                {joined_descriptions}
-            """
+        return parse_marked_descriptions(output_text, len(part))
+    except ChunkValidationError:
+        # Don't let a malformed reply be served from the cache on retry
+        discard = getattr(client, 'discard', None)
+        if discard is not None:
+            discard(model=OPTIMIZE_MODEL, messages=messages, **params)
+        raise
+
+def optimize_chunk(client, part, label, input_tokens, attempts=2, phrases=()):
+    # Optimize one chunk, retrying a malformed reply and then splitting the
+    # chunk in half so one bad reply doesn't sink the whole chunk
+    for attempt in range(attempts):
+        try:
+            return optimize_part(client, part, label, input_tokens, phrases)
+        except ChunkValidationError as e:
+            print(f"Invalid reply for {label} (attempt {attempt + 1}/{attempts}): {e}")
 
-            # Load the tokenizer for your model
-            tokenizer = tiktoken.encoding_for_model("gpt-4o")
-
-            # Count tokens
-            token_count = len(tokenizer.encode(prompt))
-            print(f"Input token count for part {idx + 1}: {token_count}")
-
-            # use mini for higher token limit in this case
-            completion = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                max_completion_tokens=16384
+    if len(part) == 1:
+        raise ChunkValidationError(f"{label} could not be optimized")
+
+    middle = len(part) // 2
+    print(f"Splitting {label} into two smaller chunks")
+    halves = [part[:middle], part[middle:]]
+    results = []
+    for half, suffix in zip(halves, 'ab'):
+        half_tokens = input_tokens * len(half) // len(part)
+        results.extend(optimize_chunk(client, half, f"{label}{suffix}", half_tokens, attempts, phrases))
+    return results
+
+def optimize_units(descriptions, chunks):
+    return [
+        (unit_id('optimize', chunk_descriptions(descriptions, chunk)), f"optimize part {idx + 1}")
+        for idx, chunk in enumerate(chunks)
+    ]
+
+def optimize_descriptions(client, descriptions, journal=None, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                          max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, concurrency=1, repetitive_only=True):
+    # Split the descriptions that need it into token-budgeted chunks
+    chunks = plan_optimize(descriptions, max_input_tokens, max_output_tokens, repetitive_only)
+    units = optimize_units(descriptions, chunks)
+    sent = sum(len(chunk['indices']) for chunk in chunks)
+    print(f"Optimizing {sent} of {len(descriptions)} descriptions in {len(chunks)} parts")
+
+    def optimize(idx):
+        chunk = chunks[idx]
+        unit, label = units[idx]
+        if journal is not None and journal.is_complete(unit):
+            print(f"Skipping part {idx + 1} (already optimized)")
+            return journal.result(unit)
+
+        # Keep going after a failed part so every other part gets checkpointed
+        part = chunk_descriptions(descriptions, chunk)
+        try:
+            cleaned_descriptions = optimize_chunk(
+                client, part, f"part {idx + 1}", chunk['input_tokens'], phrases=chunk['phrases']
             )
+        except Exception as e:
+            print(f"Error optimizing part {idx + 1}: {e}")
+            return None
 
-            # Count tokens
-            token_count = len(tokenizer.encode(completion.choices[0].message.content.strip()))
-            print(f"Output token count for part {idx + 1}: {token_count}")
-
-            # Split and clean up each description
-            split_descriptions = completion.choices[0].message.content.strip().split("UNIQUE_SEPARATOR")
-            cleaned_descriptions = [
-                desc.strip().strip('\n').strip()
-                for desc in split_descriptions
-            ]
-            all_output_descriptions.extend(cleaned_descriptions)
-        return all_output_descriptions
-    except Exception as e:
-        print(f"Error optimizing descriptions: {e}")
+        if journal is not None:
+            journal.record(unit, cleaned_descriptions, label=label)
+        return cleaned_descriptions
+
+    # Submit all chunks at once, up to `concurrency` in flight
+    results = run_concurrently(optimize, range(len(chunks)), max_workers=concurrency)
+
+    failed_parts = [idx + 1 for idx, result in enumerate(results) if result is None]
+    if failed_parts:
+        print(f"Error optimizing descriptions: parts {failed_parts} failed, rerun with --resume")
         return None
 
+    # Descriptions that weren't sent keep their text
+    optimized = list(descriptions)
+    for chunk, result in zip(chunks, results):
+        for index, description in zip(chunk['indices'], result):
+            optimized[index] = description
+    return optimized
+
+def batch_rewrite(transport, parks_data, journal, poll_interval=60):
+    # Send every rewrite not yet in the journal as one batch job and journal
+    # the replies. Anything the batch couldn't answer is left for the
+    # regular rewrite pass.
+    pending = {}
+    for park in parks_data:
+        unit = describe_unit(park)
+        if not journal.is_complete(unit):
+            pending[unit] = park
+    if not pending:
+        return
+
+    requests = [
+        (unit, {
+            "model": REWRITE_MODEL,
+            "store": True,
+            "messages": build_rewrite_messages(park['Name'], park['Description']),
+        })
+        for unit, park in pending.items()
+    ]
+    results, errors = run_batch(transport, requests, REWRITE_BATCH_PATH, poll_interval, journal=journal)
+    for unit, park in pending.items():
+        if unit in results:
+            journal.record(unit, results[unit], label=f"describe {park['Name']}")
+        else:
+            print(f"Batch rewrite failed for {park['Name']}: {errors.get(unit, 'no result')}")
+
+def batch_optimize(transport, descriptions, journal, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                   max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, poll_interval=60, repetitive_only=True):
+    # Same as batch_rewrite for the optimization chunks. Replies that fail
+    # marker validation are left for optimize_descriptions to retry.
+    chunks = plan_optimize(descriptions, max_input_tokens, max_output_tokens, repetitive_only)
+    pending = {}
+    for chunk, (unit, label) in zip(chunks, optimize_units(descriptions, chunks)):
+        if not journal.is_complete(unit):
+            pending[unit] = (chunk_descriptions(descriptions, chunk), label, chunk['phrases'])
+    if not pending:
+        return
+
+    requests = [
+        (unit, {
+            "model": OPTIMIZE_MODEL,
+            "messages": build_optimize_messages(part, phrases),
+            "max_completion_tokens": DEFAULT_MAX_OUTPUT_TOKENS,
+        })
+        for unit, (part, _, phrases) in pending.items()
+    ]
+    results, errors = run_batch(transport, requests, OPTIMIZE_BATCH_PATH, poll_interval, journal=journal)
+    for unit, (part, label, _) in pending.items():
+        try:
+            if unit not in results:
+                raise ChunkValidationError(errors.get(unit, 'no result'))
+            journal.record(unit, parse_marked_descriptions(results[unit], len(part)), label=label)
+        except ChunkValidationError as e:
+            print(f"Batch {label} failed, will retry it directly: {e}")
+
+def content_hash(*fields):
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+def source_hash(park):
+    return content_hash(park['Name'], park['Description'])
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def save_manifest(parks_data, rewritten_descriptions, manifest, path=MANIFEST_PATH, source_changed=True,
+                  skip=(), optimized_descriptions=None, optimized_indices=(), plan=None):
+    # Record what the current outputs were generated from. In optimize-only
+    # mode the source hashes are carried over from the previous manifest.
+    # Parks in `skip` are left out so the next run treats them as changed.
+    # Each park also records the hash of its optimized text, whether it went
+    # to the optimizer and under which plan (mode and token budgets), so a
+    # later run only reuses optimized text that the same plan produced.
+    if optimized_descriptions is None:
+        optimized_descriptions = rewritten_descriptions
+    optimized_indices = set(optimized_indices)
+    new_manifest = {}
+    for index, (park, description, optimized) in enumerate(
+        zip(parks_data, rewritten_descriptions, optimized_descriptions)
+    ):
+        if park['Name'] in skip:
+            continue
+        previous = manifest.get(park['Name'], {})
+        new_manifest[park['Name']] = {
+            'source_hash': source_hash(park) if source_changed else previous.get('source_hash'),
+            'rewrite_hash': content_hash(description),
+            'optimized_hash': content_hash(optimized),
+            'optimized': index in optimized_indices,
+            'optimize_plan': plan,
+        }
+    with open(path, 'w') as file:
+        json.dump(new_manifest, file, indent=2)
+
+def load_previous_descriptions(path):
+    # Map park name to description from an earlier output file, if there is one
+    if not os.path.exists(path):
+        return {}
+    return {park['Name']: park['Description'] for park in load_records(path)}
+
+def reuse_unchanged_rewrites(journal, parks_data, manifest, previous_rewrites, previous_optimized):
+    # Journal the previous rewrite of every park whose source is unchanged so
+    # the rewrite pass skips it. Returns a per-park unchanged flag.
+    unchanged = []
+    for park in parks_data:
+        name = park['Name']
+        entry = manifest.get(name, {})
+        same = (
+            entry.get('source_hash') == source_hash(park) and
+            name in previous_rewrites and name in previous_optimized and
+            entry.get('rewrite_hash') == content_hash(previous_rewrites[name])
+        )
+        if same and not journal.is_complete(describe_unit(park)):
+            journal.record(describe_unit(park), previous_rewrites[name], label=f"describe {name} (unchanged)")
+        unchanged.append(same)
+    print(f"{sum(unchanged)} parks unchanged, {len(unchanged) - sum(unchanged)} new or changed")
+    return unchanged
+
+def reuse_unchanged_chunks(journal, parks_data, descriptions, unchanged, previous_optimized, manifest,
+                           max_input_tokens=DEFAULT_MAX_INPUT_TOKENS, max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS,
+                           repetitive_only=True):
+    # Journal the previous optimization of every chunk made up only of
+    # unchanged parks that the last run sent to the optimizer under the same
+    # plan, so only chunks containing a changed park are re-optimized.
+    # Returns the positions of every description the plan optimizes.
+    plan = {
+        'max_input_tokens': max_input_tokens,
+        'max_output_tokens': max_output_tokens,
+        'repetitive_only': repetitive_only,
+    }
+
+    def already_optimized(index):
+        # The output file must still hold the text the manifest recorded
+        name = parks_data[index]['Name']
+        entry = manifest.get(name, {})
+        return (
+            unchanged[index] and entry.get('optimized') is True and entry.get('optimize_plan') == plan and
+            entry.get('rewrite_hash') == content_hash(descriptions[index]) and
+            entry.get('optimized_hash') == content_hash(previous_optimized[name])
+        )
+
+    chunks = plan_optimize(descriptions, max_input_tokens, max_output_tokens, repetitive_only)
+    reused = 0
+    for chunk, (unit, label) in zip(chunks, optimize_units(descriptions, chunks)):
+        if all(already_optimized(index) for index in chunk['indices']) and not journal.is_complete(unit):
+            previous = [previous_optimized[parks_data[index]['Name']] for index in chunk['indices']]
+            journal.record(unit, previous, label=f"{label} (unchanged)")
+            reused += 1
+    print(f"{reused} of {len(chunks)} optimization parts unchanged")
+    return [index for chunk in chunks for index in chunk['indices']]
+
+def print_dry_run(parks_data, optimize_only=False, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                  max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, repetitive_only=True):
+    # Show the planned API work and its estimated cost without calling the API
+    descriptions = [park['Description'] for park in parks_data]
+    if not optimize_only:
+        rewrite_input = sum(count_tokens(descriptions, REWRITE_MODEL))
+        cost = estimate_cost(rewrite_input, rewrite_input, REWRITE_MODEL)
+        print(
+            f"Rewrite pass: {len(descriptions)} calls, ~{rewrite_input} description tokens in, "
+            f"~${cost:.4f} with {REWRITE_MODEL} (assuming similar length output)"
+        )
+        print("Optimize pass (planned on the current descriptions):")
+    if repetitive_only:
+        print_analysis(analyze_descriptions(descriptions), [park['Name'] for park in parks_data])
+    print_plan(plan_optimize(descriptions, max_input_tokens, max_output_tokens, repetitive_only), OPTIMIZE_MODEL)
+
+def print_status(journal, parks_data, optimize_only=False, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                 max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, repetitive_only=True):
+    # Report which units of the run are done and which are still pending
+    if optimize_only:
+        descriptions = [park['Description'] for park in parks_data]
+        completed, pending = [], []
+    else:
+        describe = [(describe_unit(park), f"describe {park['Name']}") for park in parks_data]
+        completed, pending = journal.status(describe)
+        descriptions = None
+        if not pending:
+            descriptions = [journal.result(unit) for unit, _ in describe]
+
+    if descriptions is None:
+        pending.append("optimize (waiting on rewrites)")
+    else:
+        chunks = plan_optimize(descriptions, max_input_tokens, max_output_tokens, repetitive_only)
+        optimize_completed, optimize_pending = journal.status(optimize_units(descriptions, chunks))
+        completed += optimize_completed
+        pending += optimize_pending
+
+    print(f"Completed units: {len(completed)}")
+    for label in completed:
+        print(f"  done     {label}")
+    print(f"Pending units: {len(pending)}")
+    for label in pending:
+        print(f"  pending  {label}")
+
+def finish_run(client):
+    client.client.print_stats()
+    client.print_stats()
+    telemetry.cache_stats(client.cache.stats())
+    telemetry.print_summary()
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Update national park descriptions')
     parser.add_argument('--optimize-only', action='store_true', 
                        help='Only perform optimization on existing updated descriptions')
+    parser.add_argument('--concurrency', type=int, default=1,
+                       help='Number of rewrites or optimization chunks to run at once')
+    parser.add_argument('--rpm', type=int, default=60,
+                       help='Requests-per-minute budget for API calls (not applied with --stub)')
+    parser.add_argument('--tpm', type=int, default=30000,
+                       help='Tokens-per-minute budget for API calls (not applied with --stub)')
+    parser.add_argument('--stub', action='store_true',
+                       help='Use a local stub client instead of the OpenAI API')
+    parser.add_argument('--stub-latency', type=float, default=0.5,
+                       help='Simulated seconds per call for --stub')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0,
+                       help='Fraction of --stub calls that fail with a 429')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Always call the API instead of reusing cached responses')
+    parser.add_argument('--cache-path',
+                       help=f'SQLite file used to cache API responses (default: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--resume', action='store_true',
+                       help='Resume from the journal of an interrupted run')
+    parser.add_argument('--status', action='store_true',
+                       help='Report completed and pending units from the journal and exit')
+    parser.add_argument('--max-input-tokens', type=int, default=DEFAULT_MAX_INPUT_TOKENS,
+                       help='Prompt token budget for each optimization chunk')
+    parser.add_argument('--max-output-tokens', type=int, default=DEFAULT_MAX_OUTPUT_TOKENS,
+                       help='Expected reply token budget for each optimization chunk')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Print the chunk plan and estimated cost without calling the API')
+    parser.add_argument('--batch', action='store_true',
+                       help='Submit the rewrite and optimize passes through the Batch API')
+    parser.add_argument('--batch-dir',
+                       help='Run --batch against a local file-based stand-in in this directory')
+    parser.add_argument('--batch-poll-interval', type=int, default=60,
+                       help='Seconds between batch status checks')
+    parser.add_argument('--full', action='store_true',
+                       help='Regenerate every park, not just the ones whose source changed')
+    parser.add_argument('--optimize-all', action='store_true',
+                       help='Send every description to the optimizer, not just the ones with repeated phrases')
     args = parser.parse_args()
+    budgets = {
+        'max_input_tokens': args.max_input_tokens,
+        'max_output_tokens': args.max_output_tokens,
+        'repetitive_only': not args.optimize_all,
+    }
+
+    # A stub run keeps its own journal, manifest, cache and outputs so its
+    # fake text is never mistaken for real results by a later run
+    backend = 'stub' if args.stub else DEFAULT_BACKEND
+    journal_path, manifest_path, rewrite_path, optimized_path = (
+        backend_path(path, backend) for path in (JOURNAL_PATH, MANIFEST_PATH, REWRITE_PATH, OPTIMIZED_PATH)
+    )
+    cache_path = args.cache_path or backend_path(DEFAULT_CACHE_PATH, backend)
 
-    # Load environment variables from .env file
-    load_dotenv()
+    if args.status or args.dry_run:
+        input_file = rewrite_path if args.optimize_only else SOURCE_PATH
+        with open(input_file, 'r') as file:
+            parks_data = json.load(file)
+        if args.dry_run:
+            print_dry_run(parks_data, args.optimize_only, **budgets)
+        else:
+            print_status(RunJournal(journal_path, resume=True), parks_data, args.optimize_only, **budgets)
+        return
 
-    # Set up OpenAI API key from environment variable
-    api_key = os.getenv('GPT_API_KEY')
-    client = OpenAI(api_key=api_key)
+    journal = RunJournal(journal_path, resume=args.resume)
+
+    # Record latency, tokens and cost of every call that reaches the API
+    if args.stub:
+        llm = LLMClient('stub', telemetry=telemetry, latency=args.stub_latency, rate_limit_rate=args.stub_error_rate)
+    else:
+        llm = LLMClient('openai', telemetry=telemetry)
+
+    # Batch jobs go around the response cache; their results land in the journal instead
+    transport = None
+    if args.batch_dir:
+        transport = LocalBatchTransport(args.batch_dir, llm.client)
+    elif args.batch:
+        transport = OpenAIBatchTransport(llm.client)
+
+    # Reuse responses from earlier runs so a rerun only pays for new calls.
+    # Only calls that miss the cache wait on the rate limit, and the stub
+    # has no quota to respect.
+    if args.stub:
+        limited = llm
+    else:
+        limited = RateLimitedClient(llm, RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm))
+    client = CachedClient(limited, ResponseCache(cache_path), bypass=args.no_cache)
 
     if args.optimize_only:
         print("\nRunning optimization-only mode...")
         # Read the previously updated JSON file
-        with open('updated_national_parks.json', 'r') as file:
-            parks_data = json.load(file)
+        parks_data = load_records(rewrite_path)
         
         # Extract existing descriptions
         descriptions = [park['Description'] for park in parks_data]
         
+        # Reuse the optimized text of chunks whose input hasn't changed
+        manifest = {} if args.full else load_manifest(manifest_path)
+        previous_optimized = load_previous_descriptions(optimized_path)
+        unchanged = [
+            manifest.get(park['Name'], {}).get('rewrite_hash') == content_hash(park['Description']) and
+            park['Name'] in previous_optimized
+            for park in parks_data
+        ]
+        optimized_indices = reuse_unchanged_chunks(
+            journal, parks_data, descriptions, unchanged, previous_optimized, manifest, **budgets
+        )
+        
         # Optimize descriptions
         print("Optimizing all descriptions...")
-        optimized_descriptions = optimize_descriptions(client, descriptions)
+        if transport is not None:
+            with telemetry.stage('batch optimize'):
+                batch_optimize(transport, descriptions, journal, poll_interval=args.batch_poll_interval, **budgets)
+        with telemetry.stage('optimize'):
+            optimized_descriptions = optimize_descriptions(
+                client, descriptions, journal=journal, concurrency=args.concurrency, **budgets
+            )
         
         if optimized_descriptions:
             # Update parks with optimized descriptions
@@ -136,40 +624,39 @@ def main():
                 updated_parks.append(updated_park)
             
             # Save back to the same file
-            with open('updated_optimized_national_parks.json', 'w') as file:
-                json.dump(updated_parks, file, indent=2)
+            save_records(updated_parks, optimized_path)
+            save_manifest(parks_data, descriptions, manifest, manifest_path, source_changed=False,
+                          optimized_descriptions=optimized_descriptions, optimized_indices=optimized_indices,
+                          plan=budgets)
             print("Optimization complete. File has been updated.")
         else:
             print("Error during optimization. No changes made.")
+        finish_run(client)
+        if not optimized_descriptions:
+            # Exit non-zero so pipeline.py doesn't record the run as current
+            sys.exit(1)
         return
 
     # Original mode - full update process
-    with open('national_parks.json', 'r') as file:
+    with open(SOURCE_PATH, 'r') as file:
         parks_data = json.load(file)
     
     # Create a new list to store updated parks
     updated_parks = []
-    new_descriptions = []
+    
+    # Only parks whose name or description changed since the last run need new text
+    manifest = {} if args.full else load_manifest(manifest_path)
+    previous_optimized = load_previous_descriptions(optimized_path)
+    unchanged = reuse_unchanged_rewrites(
+        journal, parks_data, manifest, load_previous_descriptions(rewrite_path), previous_optimized
+    )
     
     # First pass: Get new descriptions for each park
-    for park in parks_data:
-        print(f"\nProcessing: {park['Name']}")
-        
-        # Get new description from ChatGPT
-        new_description = get_new_description(client, park['Name'], park['Description'])
-        
-        if new_description:
-            new_descriptions.append(new_description)
-            # Print original and new descriptions
-            print("\nOriginal Description:")
-            print(park['Description'])
-            print("\nNew Description:")
-            print(new_description)
-            
-            # Add delay to respect API rate limits
-            time.sleep(1)
-        else:
-            new_descriptions.append(park['Description'])
+    if transport is not None:
+        with telemetry.stage('batch rewrite'):
+            batch_rewrite(transport, parks_data, journal, args.batch_poll_interval)
+    with telemetry.stage('rewrite'):
+        new_descriptions = rewrite_descriptions(client, parks_data, args.concurrency, journal)
     
     # Save the initial updated descriptions before optimization
     initial_updated_parks = []
@@ -178,13 +665,26 @@ def main():
         updated_park['Description'] = new_description
         initial_updated_parks.append(updated_park)
     
-    with open('updated_national_parks.json', 'w') as file:
-        json.dump(initial_updated_parks, file, indent=2)
-    print("\nSaved initial updates to updated_national_parks.json")
+    save_records(initial_updated_parks, rewrite_path)
+    print(f"\nSaved initial updates to {rewrite_path}")
     
     # Second pass: Optimize all descriptions together
     print("\nOptimizing all descriptions...")
-    optimized_descriptions = optimize_descriptions(client, new_descriptions)
+    optimized_indices = reuse_unchanged_chunks(
+        journal, parks_data, new_descriptions, unchanged, previous_optimized, manifest, **budgets
+    )
+    if transport is not None:
+        with telemetry.stage('batch optimize'):
+            batch_optimize(transport, new_descriptions, journal, poll_interval=args.batch_poll_interval, **budgets)
+    with telemetry.stage('optimize'):
+        optimized_descriptions = optimize_descriptions(
+            client, new_descriptions, journal=journal, concurrency=args.concurrency, **budgets
+        )
+    if not optimized_descriptions:
+        print("Error during optimization. Rerun with --resume to retry the failed parts.")
+        finish_run(client)
+        # Exit non-zero so pipeline.py doesn't record the run as current
+        sys.exit(1)
     
     # Create final updated parks data
     for park, optimized_description in zip(parks_data, optimized_descriptions):
@@ -193,9 +693,18 @@ def main():
         updated_parks.append(updated_park)
     
     # Save optimized data to new file
-    with open('updated_optimized_national_parks.json', 'w') as file:
-        json.dump(updated_parks, file, indent=2)
-    print("Saved optimized version to updated_optimized_national_parks.json")
+    save_records(updated_parks, optimized_path)
+    # A park whose rewrite failed kept its original text, so try it again next run
+    failed_rewrites = {park['Name'] for park in parks_data if not journal.is_complete(describe_unit(park))}
+    save_manifest(parks_data, new_descriptions, manifest, manifest_path, skip=failed_rewrites,
+                  optimized_descriptions=optimized_descriptions, optimized_indices=optimized_indices,
+                  plan=budgets)
+    print(f"Saved optimized version to {optimized_path}")
+    finish_run(client)
+    if failed_rewrites:
+        print(f"Rewriting failed for {len(failed_rewrites)} parks, which kept their original description. "
+              "Rerun to retry them.")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file